@@ -0,0 +1,696 @@
+"""Offline-Benchmark für den Musik-Bot.
+
+Ersetzt yt_dlp.YoutubeDL, die Discord-Objekte (Server, Kanäle, Nachrichten, Interaktionen)
+und discord.VoiceClient durch lokale Attrappen mit einstellbarer Latenz und Fehlerquote.
+Die Audiodateien werden einmalig mit ffmpeg erzeugt und über einen lokalen HTTP-Server
+ausgeliefert, sodass ffmpeg genau wie im Betrieb Stream-URLs abspielt. Auf vielen
+simulierten Servern werden dann /play, /play-album, die Autovervollständigung, /skip,
+/prev und /queue ausgeführt.
+
+Die yt-dlp-Kommandozeile braucht keine eigene Attrappe mehr: Die Suche läuft inzwischen in
+den vorgewärmten Worker-Prozessen (AutocompleteSearchPool), die hier ebenfalls die
+gefälschte YoutubeDL-Klasse verwenden.
+
+Beispiel:
+    python benchmark.py --guilds 50 --ops 40 --json run.json
+    python benchmark.py --guilds 50 --ops 40 --baseline run.json
+
+Voraussetzung ist nur ffmpeg im PATH, weder Discord noch YouTube werden kontaktiert.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from aiohttp import web
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+FRAME_SECONDS = 0.02
+OPERATIONS = ("autocomplete", "play", "play_album", "skip", "prev", "queue")
+WORDS = ("lofi", "beats", "rock", "classic", "jazz", "piano", "summer", "night", "drive", "metal",
+         "acoustic", "cover", "live", "remix", "chill", "study", "retro", "synthwave", "guitar", "violin")
+
+
+def percentile(values, p: float) -> float:
+    """Exaktes p-Quantil (0-1) einer Liste von Messwerten."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+
+# --- Gefälschtes YouTube ---
+class FakeCatalog:
+    """Deterministischer Katalog: jede Anfrage ergibt immer dieselben Videos und Playlists."""
+
+    def __init__(self, base_url: str, fixtures: list[tuple[str, str, float]], latency: float, jitter: float,
+                 failure_rate: float, throttle_rate: float, playlist_size: int):
+        self.base_url = base_url
+        self.fixtures = fixtures  # (Dateiname, Codec, Dauer)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.playlist_size = playlist_size
+
+    def wait_or_fail(self, url: str):
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        roll = random.random()
+        if roll < self.throttle_rate:
+            raise FakeDownloadError("ERROR: [youtube] HTTP Error 429: Too Many Requests")
+        if roll < self.throttle_rate + self.failure_rate:
+            raise FakeDownloadError(f"ERROR: [youtube] {url}: Video unavailable")
+
+    @staticmethod
+    def video_id(seed: str) -> str:
+        return hashlib.sha1(seed.encode()).hexdigest()[:11]
+
+    def flat_entry(self, video_id: str) -> dict:
+        _, _, duration = self.fixtures[int(video_id, 16) % len(self.fixtures)]
+        return {
+            "url": f"https://www.youtube.com/watch?v={video_id}",
+            "title": f"Song {video_id}",
+            "channel": f"Kanal {video_id[:3]}",
+            "duration": duration,
+        }
+
+    def video(self, video_id: str) -> dict:
+        filename, acodec, duration = self.fixtures[int(video_id, 16) % len(self.fixtures)]
+        expire = int(time.time()) + 6 * 60 * 60
+        return {
+            **self.flat_entry(video_id),
+            "id": video_id,
+            "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+            "url": f"{self.base_url}/audio/{filename}?id={video_id}&expire={expire}",
+            "uploader": f"Kanal {video_id[:3]}",
+            "acodec": acodec,
+            "ext": filename.rsplit(".", 1)[1],
+            "filename": filename,
+        }
+
+    def extract(self, url: str, flat: bool) -> dict:
+        self.wait_or_fail(url)
+        if url.startswith("ytsearch"):
+            count, _, query = url[len("ytsearch"):].partition(":")
+            ids = [self.video_id(f"{query}#{i}") for i in range(int(count or 1))]
+            entries = [self.flat_entry(i) if flat else self.video(i) for i in ids]
+            return {"_type": "playlist", "title": query, "entries": entries}
+        parsed = urllib.parse.urlparse(url)
+        params = urllib.parse.parse_qs(parsed.query)
+        if parsed.path == "/results":
+            query = params.get("search_query", [""])[0]
+            return {"_type": "playlist", "entries": [
+                {"title": f"Playlist {query} {i}", "url": f"https://www.youtube.com/playlist?list={self.video_id(f'{query}@{i}')}"}
+                for i in range(10)
+            ]}
+        if "list" in params:
+            playlist_id = params["list"][0]
+            return {
+                "_type": "playlist",
+                "title": f"Playlist {playlist_id}",
+                "channel": f"Kanal {playlist_id[:3]}",
+                "entries": [self.flat_entry(self.video_id(f"{playlist_id}#{i}")) for i in range(self.playlist_size)],
+            }
+        return self.video(params.get("v", [self.video_id(url)])[0])
+
+
+class FakeDownloadError(Exception):
+    pass
+
+
+class FakeYoutubeDL:
+    """Ersetzt yt_dlp.YoutubeDL. Downloads kopieren die passende lokale Datei nach outtmpl."""
+    catalog: FakeCatalog = None
+    audio_dir: str = None
+
+    def __init__(self, params: dict = None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def extract_info(self, url: str, download: bool = False):
+        try:
+            info = self.catalog.extract(url, flat=bool(self.params.get("extract_flat")))
+        except FakeDownloadError:
+            if self.params.get("ignoreerrors"):
+                return None
+            raise
+        if download and "filename" in info:
+            shutil.copyfile(os.path.join(self.audio_dir, info["filename"]), self.prepare_filename(info))
+        return info
+
+    def prepare_filename(self, info: dict) -> str:
+        return self.params.get("outtmpl", "%(id)s.%(ext)s") % {"id": info.get("id"), "ext": info.get("ext")}
+
+
+def create_fixtures(audio_dir: str, track_seconds: float) -> list[tuple[str, str, float]]:
+    """Erzeugt Testsongs mit ffmpeg: WebM/Opus (wird durchgereicht) und MP3 (wird umkodiert)."""
+    fixtures = []
+    for index, (ext, codec_args, acodec) in enumerate((
+        ("webm", ["-c:a", "libopus", "-b:a", "128k"], "opus"),
+        ("mp3", ["-c:a", "libmp3lame", "-b:a", "128k"], "mp3"),
+        ("webm", ["-c:a", "libopus", "-b:a", "96k"], "opus"),
+    )):
+        filename = f"track{index}.{ext}"
+        path = os.path.join(audio_dir, filename)
+        if not os.path.isfile(path):
+            subprocess.run(
+                ["ffmpeg", "-loglevel", "error", "-y", "-f", "lavfi",
+                 "-i", f"sine=frequency={220 * (index + 1)}:sample_rate=48000:duration={track_seconds}",
+                 "-ac", "2", *codec_args, path],
+                check=True,
+            )
+        fixtures.append((filename, acodec, track_seconds))
+    return fixtures
+
+
+async def start_file_server(audio_dir: str) -> tuple[web.AppRunner, str]:
+    """Liefert die Testsongs per HTTP aus, damit ffmpeg wie bei YouTube eine URL streamt."""
+    app = web.Application()
+    app.router.add_static("/audio/", audio_dir)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+# --- Gefälschtes Discord ---
+class GuildResult:
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.latencies = {name: [] for name in OPERATIONS}
+        self.errors = 0
+        self.tracks = 0
+        self.frames = 0
+        self.late_frames = 0
+        self.player_cpu = 0.0
+        self.ffmpeg_cpu = 0.0
+        self.rest_calls = 0
+        self.state_bytes = 0
+
+
+class FakeVoiceWebSocket:
+    async def speak(self, state):
+        pass
+
+
+class FakeVoiceClient:
+    """Liest die Audioquelle in einem eigenen Thread wie discord.player.AudioPlayer, aber ohne UDP.
+
+    Mit speed > 1 werden die 20ms-Frames schneller abgerufen als in Echtzeit, damit kurze
+    Läufe viele Songwechsel enthalten. Verspätete Frames werden gezählt.
+
+    Mit --scheduler shared setzt bot.AudioScheduler wie bei einem echten VoiceClient _player
+    und sendet über send_audio_packet, verspätete Frames zählt dann der Bot selbst.
+    """
+
+    def __init__(self, guild, channel, speed: float, result: GuildResult):
+        self.guild = guild
+        self.channel = channel
+        self.speed = speed
+        self.result = result
+        self.source = None
+        self.thread = None
+        self.stopped = threading.Event()
+        self.resumed = threading.Event()
+        self.resumed.set()
+        self.connected = True
+        self.scheduled = None
+        self.ws = FakeVoiceWebSocket()
+        self.encoder = None
+
+    @property
+    def _player(self):
+        return self.scheduled
+
+    @_player.setter
+    def _player(self, player):
+        if player is not None:
+            self.source = player.source
+            self.result.tracks += 1
+        self.scheduled = player
+
+    def send_audio_packet(self, data: bytes, encode: bool = True):
+        self.result.frames += 1
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def is_playing(self) -> bool:
+        if self.scheduled:
+            return self.scheduled.is_playing()
+        return self.thread is not None and self.thread.is_alive() and self.resumed.is_set()
+
+    def is_paused(self) -> bool:
+        if self.scheduled:
+            return self.scheduled.is_paused()
+        return self.thread is not None and self.thread.is_alive() and not self.resumed.is_set()
+
+    def play(self, source, *, after=None, **kwargs):
+        if self.is_playing() or self.is_paused():
+            raise RuntimeError("Already playing audio.")
+        self.source = source
+        self.stopped = threading.Event()
+        self.resumed.set()
+        self.thread = threading.Thread(target=self.run, args=(source, after, self.stopped), daemon=True)
+        self.thread.start()
+
+    def run(self, source, after, stopped: threading.Event):
+        interval = FRAME_SECONDS / self.speed
+        cpu_start = time.thread_time()
+        next_frame = time.perf_counter()
+        error = None
+        try:
+            while not stopped.is_set():
+                if not self.resumed.is_set():
+                    self.resumed.wait()
+                    next_frame = time.perf_counter()
+                    continue
+                data = source.read()
+                if not data:
+                    break
+                self.result.frames += 1
+                next_frame += interval
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.result.late_frames += 1
+        except Exception as e:
+            error = e
+        finally:
+            self.result.player_cpu += time.thread_time() - cpu_start
+            process = getattr(getattr(source, "source", None), "_process", None)
+            if process:
+                self.result.ffmpeg_cpu += bot.process_cpu_seconds(process.pid)
+            self.result.tracks += 1
+            if after:
+                after(error)
+            source.cleanup()
+
+    def stop(self):
+        if self.scheduled:
+            self.scheduled.stop()
+            self.scheduled = None
+        self.stopped.set()
+        self.resumed.set()
+
+    def pause(self):
+        if self.scheduled:
+            self.scheduled.pause()
+        self.resumed.clear()
+
+    def resume(self):
+        if self.scheduled:
+            self.scheduled.resume()
+        self.resumed.set()
+
+    async def disconnect(self, *, force: bool = False):
+        self.stop()
+        self.connected = False
+        self.guild.voice_client = None
+
+
+class FakeMessage:
+    ids = itertools.count(1)
+
+    def __init__(self, channel, content: str):
+        self.id = next(self.ids)
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, **kwargs):
+        await self.channel.rest_call()
+        self.content = kwargs.get("content", self.content)
+
+    async def pin(self):
+        await self.channel.rest_call()
+
+    async def unpin(self):
+        await self.channel.rest_call()
+
+
+class FakeTextChannel:
+    def __init__(self, channel_id: int, rest_latency: float, result: GuildResult):
+        self.id = channel_id
+        self.rest_latency = rest_latency
+        self.result = result
+
+    async def rest_call(self):
+        self.result.rest_calls += 1
+        await asyncio.sleep(self.rest_latency)
+
+    async def send(self, content: str = None, **kwargs):
+        await self.rest_call()
+        return FakeMessage(self, content)
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild, speed: float, connect_latency: float, result: GuildResult):
+        self.guild = guild
+        self.name = f"Sprachkanal {guild.id}"
+        self.speed = speed
+        self.connect_latency = connect_latency
+        self.result = result
+
+    async def connect(self, **kwargs):
+        await asyncio.sleep(self.connect_latency)
+        self.guild.voice_client = FakeVoiceClient(self.guild, self, self.speed, self.result)
+        return self.guild.voice_client
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, text_channel: FakeTextChannel):
+        self.id = guild_id
+        self.name = f"Server {guild_id}"
+        self.voice_client = None
+        self.text_channels = [text_channel]
+
+
+class FakeResponse:
+    def __init__(self, channel: FakeTextChannel):
+        self.channel = channel
+        self.done = False
+
+    def is_done(self) -> bool:
+        return self.done
+
+    async def defer(self, **kwargs):
+        self.done = True
+        await self.channel.rest_call()
+
+    async def send_message(self, content: str = None, **kwargs):
+        self.done = True
+        await self.channel.rest_call()
+
+    async def edit_message(self, **kwargs):
+        self.done = True
+        await self.channel.rest_call()
+
+
+class FakeFollowup:
+    def __init__(self, channel: FakeTextChannel):
+        self.channel = channel
+
+    async def send(self, content: str = None, **kwargs):
+        await self.channel.rest_call()
+        return FakeMessage(self.channel, content)
+
+
+class FakeInteraction:
+    def __init__(self, guild: FakeGuild, user, channel: FakeTextChannel):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = channel
+        self.response = FakeResponse(channel)
+        self.followup = FakeFollowup(channel)
+
+
+class FakeUser:
+    def __init__(self, user_id: int, voice_channel: FakeVoiceChannel):
+        self.id = user_id
+        self.name = f"Nutzer {user_id}"
+        self.voice = type("VoiceState", (), {"channel": voice_channel})()
+
+
+# --- Ablauf pro Server ---
+class Scenario:
+    def __init__(self, args):
+        self.args = args
+        self.weights = [args.weight_autocomplete, args.weight_play, args.weight_album,
+                        args.weight_skip, args.weight_prev, args.weight_queue]
+        self.commands = {name: bot.client.tree.get_command(name) for name in ("play", "play-album", "skip", "prev", "queue", "leave")}
+
+    def query(self, rng: random.Random) -> str:
+        # Zipf-artige Verteilung, damit wie im Betrieb manche Suchen häufig wiederkehren
+        return " ".join(WORDS[min(int(rng.paretovariate(1.2)) - 1, len(WORDS) - 1)] for _ in range(2))
+
+    async def timed(self, result: GuildResult, name: str, coro):
+        start = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            result.errors += 1
+            if self.args.verbose:
+                print(f"Server {result.guild_id}: {name} fehlgeschlagen: {e!r}")
+        result.latencies[name].append(time.perf_counter() - start)
+
+    async def run_guild(self, index: int) -> GuildResult:
+        args = self.args
+        rng = random.Random(args.seed * 100_003 + index)
+        guild_id = 10_000 + index
+        result = GuildResult(guild_id)
+        text_channel = FakeTextChannel(guild_id * 10, args.rest_latency, result)
+        guild = FakeGuild(guild_id, text_channel)
+        user = FakeUser(guild_id * 10 + 1, FakeVoiceChannel(guild, args.speed, args.connect_latency, result))
+        new_interaction = lambda: FakeInteraction(guild, user, text_channel)
+
+        await asyncio.sleep(rng.uniform(0, args.ramp_up))
+        await self.timed(result, "play", self.commands["play"].callback(new_interaction(), self.query(rng)))
+        for _ in range(args.ops):
+            await asyncio.sleep(rng.expovariate(1 / args.think) if args.think else 0)
+            name = rng.choices(OPERATIONS, self.weights)[0]
+            if name == "autocomplete":
+                query = self.query(rng)
+                interaction = new_interaction()
+                # Tastendruck für Tastendruck wie im Discord-Client
+                for end in range(3, len(query) + 1):
+                    await self.timed(result, name, bot.get_songs(interaction, query[:end]))
+                    await asyncio.sleep(args.keystroke_delay)
+            elif name == "play":
+                await self.timed(result, name, self.commands["play"].callback(new_interaction(), self.query(rng)))
+            elif name == "play_album":
+                playlist = f"https://www.youtube.com/playlist?list={FakeCatalog.video_id(self.query(rng))}"
+                await self.timed(result, name, self.commands["play-album"].callback(new_interaction(), playlist))
+            elif name == "skip":
+                await self.timed(result, name, self.commands["skip"].callback(new_interaction()))
+            elif name == "prev":
+                await self.timed(result, name, self.commands["prev"].callback(new_interaction()))
+            elif name == "queue":
+                await self.timed(result, name, self.commands["queue"].callback(new_interaction()))
+
+        player = bot.guild_players.get(guild_id)
+        result.state_bytes = player.memory_usage() if player else 0
+        await asyncio.sleep(args.linger)
+        await self.commands["leave"].callback(new_interaction())
+        return result
+
+
+# --- Auswertung ---
+def summarize(results: list[GuildResult], wall: float, cpu: dict) -> dict:
+    latencies = {name: [value for result in results for value in result.latencies[name]] for name in OPERATIONS}
+    operations = sum(len(values) for values in latencies.values())
+    tracks = sum(result.tracks for result in results)
+    frames = sum(result.frames for result in results)
+    if bot.AUDIO_SCHEDULER == "shared":
+        for result in results:
+            counts = bot.audio_scheduler.guilds.get(result.guild_id, {})
+            result.late_frames = counts.get("late", 0) + counts.get("underrun", 0)
+    return {
+        "guilds": len(results),
+        "wall_seconds": wall,
+        "operations": operations,
+        "operations_per_second": operations / wall if wall else 0.0,
+        "tracks": tracks,
+        "tracks_per_second": tracks / wall if wall else 0.0,
+        "frames_per_second": frames / wall if wall else 0.0,
+        "late_frame_ratio": sum(result.late_frames for result in results) / frames if frames else 0.0,
+        "errors": sum(result.errors for result in results),
+        "rest_calls": sum(result.rest_calls for result in results),
+        "latency": {
+            name: {"count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95), "p99": percentile(values, 0.99)}
+            for name, values in latencies.items()
+        },
+        "cpu": cpu,
+        "max_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "cache_hit_ratio": {
+            labels["cache"]: value
+            for name, _, _, values in bot.metrics.samples() if name == "musicbot_cache_hit_ratio"
+            for labels, value in values
+        },
+        "per_guild": [
+            {
+                "guild": result.guild_id,
+                "operations": sum(len(values) for values in result.latencies.values()),
+                "p95": percentile([value for values in result.latencies.values() for value in values], 0.95),
+                "errors": result.errors,
+                "tracks": result.tracks,
+                "player_cpu": result.player_cpu,
+                "ffmpeg_cpu": result.ffmpeg_cpu,
+                "state_kib": result.state_bytes / 1024,
+            }
+            for result in results
+        ],
+    }
+
+
+def print_report(report: dict, show_guilds: int, baseline: dict = None):
+    def delta(value, path):
+        if not baseline:
+            return ""
+        old = baseline
+        for key in path:
+            old = old.get(key, {}) if isinstance(old, dict) else {}
+        if not isinstance(old, (int, float)) or not old:
+            return ""
+        return f"  ({(value - old) / old:+.1%})"
+
+    print(f"\n{report['guilds']} Server in {report['wall_seconds']:.1f}s")
+    for key, label in (("operations_per_second", "Befehle/s"), ("tracks_per_second", "Songs/s"),
+                       ("frames_per_second", "Frames/s"), ("late_frame_ratio", "verspätete Frames"),
+                       ("errors", "Fehler"), ("rest_calls", "REST-Aufrufe"), ("max_rss_mib", "max. RSS (MiB)")):
+        print(f"{label:>20}: {report[key]:.3f}{delta(report[key], [key])}")
+    for key, value in report["cpu"].items():
+        print(f"{'CPU ' + key:>20}: {value:.2f}s{delta(value, ['cpu', key])}")
+
+    print(f"\n{'Befehl':>14} {'Anzahl':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in report["latency"].items():
+        print(f"{name:>14} {stats['count']:>7} {stats['p50'] * 1000:>9.1f} {stats['p95'] * 1000:>9.1f} "
+              f"{stats['p99'] * 1000:>9.1f}{delta(stats['p95'], ['latency', name, 'p95'])}")
+
+    print("\nTrefferquoten: " + ", ".join(f"{name} {ratio:.0%}" for name, ratio in report["cache_hit_ratio"].items()))
+
+    worst = sorted(report["per_guild"], key=lambda guild: guild["p95"], reverse=True)[:show_guilds]
+    if worst:
+        print(f"\n{'Server':>8} {'Befehle':>8} {'p95 ms':>8} {'Fehler':>7} {'Songs':>6} {'Player-CPU':>11} {'ffmpeg-CPU':>11} {'Zustand KiB':>12}")
+        for guild in worst:
+            print(f"{guild['guild']:>8} {guild['operations']:>8} {guild['p95'] * 1000:>8.1f} {guild['errors']:>7} {guild['tracks']:>6} "
+                  f"{guild['player_cpu']:>10.2f}s {guild['ffmpeg_cpu']:>10.2f}s {guild['state_kib']:>12.1f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline-Benchmark für bot.py mit gefälschtem YouTube und Discord")
+    parser.add_argument("--guilds", type=int, default=20, help="Anzahl simulierter Server")
+    parser.add_argument("--ops", type=int, default=30, help="Befehle pro Server")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.3, help="mittlere Dauer einer yt-dlp-Anfrage in Sekunden")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Standardabweichung der yt-dlp-Dauer")
+    parser.add_argument("--failure-rate", type=float, default=0.02, help="Anteil dauerhaft fehlschlagender Anfragen")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Anteil mit HTTP 429 gedrosselter Anfragen")
+    parser.add_argument("--rate-limit", type=float, default=50.0, help="Startwert und Obergrenze des YouTube-Rate-Limits")
+    parser.add_argument("--rest-latency", type=float, default=0.03, help="Dauer eines Discord-REST-Aufrufs")
+    parser.add_argument("--connect-latency", type=float, default=0.2, help="Dauer des Verbindens mit dem Sprachkanal")
+    parser.add_argument("--speed", type=float, default=10.0, help="Abspielgeschwindigkeit gegenüber Echtzeit")
+    parser.add_argument("--track-seconds", type=float, default=20.0, help="Länge der erzeugten Testsongs")
+    parser.add_argument("--playlist-size", type=int, default=25)
+    parser.add_argument("--think", type=float, default=0.5, help="mittlere Pause zwischen zwei Befehlen eines Servers")
+    parser.add_argument("--keystroke-delay", type=float, default=0.08)
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="Server starten verteilt über so viele Sekunden")
+    parser.add_argument("--linger", type=float, default=1.0, help="Wiedergabe nach dem letzten Befehl noch so lange laufen lassen")
+    parser.add_argument("--mode", choices=("opus", "pcm"), default="opus", help="PLAYBACK_MODE des Bots")
+    parser.add_argument("--audio-cache", action="store_true", help="Audio-Cache auf der Festplatte einschalten")
+    parser.add_argument("--loudness", action="store_true", help="Lautheitsausgleich des Bots einschalten")
+    parser.add_argument("--shared-sources", action="store_true", help="SHARED_SOURCES des Bots einschalten")
+    parser.add_argument("--scheduler", choices=("threads", "shared"), default="threads", help="AUDIO_SCHEDULER des Bots")
+    parser.add_argument("--weight-autocomplete", type=float, default=3)
+    parser.add_argument("--weight-play", type=float, default=3)
+    parser.add_argument("--weight-album", type=float, default=0.5)
+    parser.add_argument("--weight-skip", type=float, default=2)
+    parser.add_argument("--weight-prev", type=float, default=1)
+    parser.add_argument("--weight-queue", type=float, default=1)
+    parser.add_argument("--workdir", help="Arbeitsverzeichnis (Standard: temporär)")
+    parser.add_argument("--json", help="Ergebnis als JSON speichern")
+    parser.add_argument("--baseline", help="JSON eines früheren Laufs zum Vergleich")
+    parser.add_argument("--show-guilds", type=int, default=10, help="so viele Server mit der schlechtesten p95 anzeigen")
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args()
+
+
+def configure_environment(args, workdir: str):
+    """Muss vor dem Import von bot.py laufen, da die Einstellungen beim Import gelesen werden."""
+    os.chdir(workdir)
+    os.makedirs("temp_audio", exist_ok=True)
+    os.environ.update({
+        "METRICS_PORT": "0",
+        "METADATA_DB_PATH": os.path.join(workdir, "metadata.db"),
+        "PLAYBACK_MODE": args.mode,
+        "AUDIO_SCHEDULER": args.scheduler,
+        "SHARED_SOURCES": "1" if args.shared_sources else "0",
+        "LOUDNESS_NORMALIZATION": "1" if args.loudness else "0",
+        "RATE_LIMIT_INITIAL": str(args.rate_limit),
+        "RATE_LIMIT_MAX": str(args.rate_limit),
+        "RATE_LIMIT_BURST": str(max(5.0, args.rate_limit)),
+        "AUDIO_CACHE_AHEAD": "2" if args.audio_cache else "0",
+        "SNAPSHOT_INTERVAL": "3600",
+    })
+
+
+async def main(args, audio_dir: str):
+    file_server, base_url = await start_file_server(audio_dir)
+    FakeYoutubeDL.catalog = FakeCatalog(base_url, create_fixtures(audio_dir, args.track_seconds), args.latency,
+                                        args.jitter, args.failure_rate, args.throttle_rate, args.playlist_size)
+    FakeYoutubeDL.audio_dir = audio_dir
+    bot.load_yt_dlp().YoutubeDL = FakeYoutubeDL
+    # Die Worker der Autovervollständigung erben die Attrappe nur per fork
+    bot.autocomplete_pool.executor = ProcessPoolExecutor(
+        max_workers=bot.AUTOCOMPLETE_WORKERS, initializer=bot.init_search_worker, mp_context=multiprocessing.get_context("fork"))
+    bot.client.loop = asyncio.get_running_loop()
+    bot.audio_scheduler.interval = FRAME_SECONDS / args.speed
+    bot.audio_cache.load()
+    bot.metadata_store.open()
+
+    scenario = Scenario(args)
+    usage_before = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(scenario.run_guild(index) for index in range(args.guilds)))
+    # Auf das Ende der letzten Wiedergabe-Threads und ffmpeg-Prozesse warten
+    await asyncio.sleep(0.5)
+    wall = time.perf_counter() - start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = {
+        "bot_user": usage_after[0].ru_utime - usage_before[0].ru_utime,
+        "bot_system": usage_after[0].ru_stime - usage_before[0].ru_stime,
+        "children": (usage_after[1].ru_utime + usage_after[1].ru_stime) - (usage_before[1].ru_utime + usage_before[1].ru_stime),
+    }
+
+    bot.autocomplete_pool.executor.shutdown(cancel_futures=True)
+    await file_server.cleanup()
+    return summarize(list(results), wall, cpu)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    args.json = args.json and os.path.abspath(args.json)
+    args.baseline = args.baseline and os.path.abspath(args.baseline)
+    if not shutil.which("ffmpeg"):
+        sys.exit("ffmpeg wurde nicht im PATH gefunden.")
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="musicbot-benchmark-"))
+    os.makedirs(workdir, exist_ok=True)
+    configure_environment(args, workdir)
+    sys.path.insert(0, repo_dir)
+    import bot
+
+    audio_dir = os.path.join(workdir, "fixtures")
+    os.makedirs(audio_dir, exist_ok=True)
+    report = asyncio.run(main(args, audio_dir))
+    report["arguments"] = vars(args)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, args.show_guilds, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -1,160 +1,303 @@
-from aiocache import cached
-from cachetools.func import ttl_cache
+from cachetools import TLRUCache, TTLCache
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from aiohttp import web
 from discord import app_commands, ui
+from discord.player import OPUS_SILENCE
 from dotenv import load_dotenv
+from queue import SimpleQueue
+import aiohttp
 import asyncio
+import bisect
 import discord
+import fcntl
+import hashlib
+import heapq
+import io
+import itertools
+import json
 import os
-import random
-import subprocess
+import re
+import select
+import signal
+import sqlite3
+import struct
+import sys
+import termios
+import threading
 import time
+import unicodedata
 import urllib.parse
-import yt_dlp
-import yt_dlp_plugins
+import weakref
+import zlib
 
+MODULE_LOADED = time.perf_counter()
 load_dotenv()
 
-try:
-    OPUS_PATH = os.getenv("OPUS_PATH")
-    if not OPUS_PATH:
-        print(">>> WARNUNG: OPUS_PATH ist in der .env-Datei nicht gesetzt. Versuche automatisches Laden.")
-        discord.opus.load_opus(None)
-    else:
-        print(f"Versuche Opus von folgendem Pfad zu laden: {OPUS_PATH}")
-        discord.opus.load_opus(OPUS_PATH)
-    print(">>> Opus-Bibliothek erfolgreich geladen!")
-except Exception as e:
-    print(f">>> KRITISCHER FEHLER beim Laden von Opus: {repr(e)}")
-    print(
-        ">>> Stelle sicher, dass die Opus-Bibliothek installiert ist oder der OPUS_PATH in der .env-Datei korrekt ist.")
-    exit(-1)
+
+def load_opus():
+    """Lädt die Opus-Bibliothek für PLAYBACK_MODE "pcm", in dem discord.py selbst kodiert."""
+    try:
+        opus_path = os.getenv("OPUS_PATH")
+        if not opus_path:
+            print(">>> WARNUNG: OPUS_PATH ist in der .env-Datei nicht gesetzt. Versuche automatisches Laden.")
+            discord.opus.load_opus(None)
+        else:
+            print(f"Versuche Opus von folgendem Pfad zu laden: {opus_path}")
+            discord.opus.load_opus(opus_path)
+        print(">>> Opus-Bibliothek erfolgreich geladen!")
+    except Exception as e:
+        print(f">>> KRITISCHER FEHLER beim Laden von Opus: {repr(e)}")
+        print(
+            ">>> Stelle sicher, dass die Opus-Bibliothek installiert ist oder der OPUS_PATH in der .env-Datei korrekt ist.")
+        exit(-1)
 
 
-YDL_OPTIONS = {'format': 'bestaudio', 'noplaylist': 'True', "plugin_dirs": yt_dlp_plugins.__path__}
-YDL_SEARCH_OPTIONS = {"flat-playlist": "True", "skip-download": "True", "quiet": "True", "ignore-errors": "True", "get-title": "True", "plugin_dirs": yt_dlp_plugins.__path__}
+YDL_OPTIONS = {'format': 'bestaudio', 'noplaylist': 'True'}
+YDL_SEARCH_OPTIONS = {"extract_flat": True, "skip_download": True, "quiet": True, "ignoreerrors": True, "playlist_items": "1:10", "source_address": "0.0.0.0"}
 FFMPEG_OPTIONS = {'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5', 'options': '-vn'}
 
-music_queues = {}
+EXTRACTOR_WORKERS = int(os.getenv("EXTRACTOR_WORKERS", "4"))
+AUTOCOMPLETE_WORKERS = int(os.getenv("AUTOCOMPLETE_WORKERS", "2"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2000"))
+SEARCH_CACHE_TTL = 24 * 60 * 60  # 24h
+PREFETCH_AHEAD = int(os.getenv("PREFETCH_AHEAD", "3"))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+RATE_LIMIT_INITIAL = float(os.getenv("RATE_LIMIT_INITIAL", "2"))  # Anfragen pro Sekunde
+RATE_LIMIT_MIN = float(os.getenv("RATE_LIMIT_MIN", "0.1"))
+RATE_LIMIT_MAX = float(os.getenv("RATE_LIMIT_MAX", "5"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "5"))
+STREAM_URL_MARGIN = 15 * 60  # so lange muss eine Stream-URL mindestens noch gültig sein
+STREAM_URL_DEFAULT_TTL = 60 * 60  # für URLs ohne expire=-Parameter
+INFO_CACHE_SIZE = int(os.getenv("INFO_CACHE_SIZE", "5000"))
+INFO_CACHE_TTL = 24 * 60 * 60  # 24h
+PERMANENT_ERROR_TTL = 24 * 60 * 60  # z.B. gelöschte oder altersbeschränkte Videos
+TRANSIENT_ERROR_TTL = 60  # z.B. Netzwerkfehler oder Drosselung
+RESOLVE_FAILURE_LIMIT = 5  # so viele nicht auflösbare Songs in Folge werden höchstens übersprungen
+METADATA_DB_PATH = os.getenv("METADATA_DB_PATH", "metadata.db")
+METADATA_DB_MAX_ROWS = int(os.getenv("METADATA_DB_MAX_ROWS", "200000"))
+METADATA_DB_COMPACT_INTERVAL = 10 * 60
+METADATA_DB_WARMUP_LOOKUPS = 200  # nach so vielen Abfragen wird die Trefferquote des Warmstarts einmal gemeldet
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "30"))
+UI_DEBOUNCE = 0.5  # so lange werden Änderungen an der "Spiele jetzt"-Nachricht gesammelt
+UI_MIN_EDIT_INTERVAL = 1.0  # Mindestabstand zwischen zwei Nachrichten-Änderungen pro Kanal
+# "opus": Opus-Quellen ohne Umkodierung durchreichen, sonst in ffmpeg nach Opus kodieren
+# "pcm": immer PCM von ffmpeg, Kodierung durch discord.py (altes Verhalten)
+PLAYBACK_MODE = os.getenv("PLAYBACK_MODE", "opus").lower()
+PLAYBACK_BITRATE = 256
+# "threads": ein AudioPlayer-Thread pro Sprachverbindung (Standard von discord.py)
+# "shared": ein gemeinsamer 20ms-Takt für alle Verbindungen, gelesen wird von AUDIO_READER_THREADS Threads
+AUDIO_SCHEDULER = os.getenv("AUDIO_SCHEDULER", "threads").lower()
+AUDIO_SCHEDULER_DISCORD_VERSION = "2.6.4"  # "shared" ersetzt VoiceClient._player, nur mit dieser Version (requirements.txt) geprüft
+AUDIO_READER_THREADS = int(os.getenv("AUDIO_READER_THREADS", "4"))
+AUDIO_BUFFER_FRAMES = 25  # Vorlauf pro Verbindung (500ms)
+AUDIO_START_BYTES = 4096  # so viel muss ffmpeg geliefert haben, bevor ein Reader-Thread zum ersten Mal liest
+AUDIO_CACHE_DIR = "temp_audio/cache"
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+AUDIO_CACHE_AHEAD = int(os.getenv("AUDIO_CACHE_AHEAD", "2"))  # 0 schaltet das Vorausladen ab
+AUDIO_CACHE_WORKERS = int(os.getenv("AUDIO_CACHE_WORKERS", "1"))
+UPLOAD_DIR = "temp_audio/uploads"
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(1024 ** 3)))
+UPLOAD_CHUNK_SIZE = 256 * 1024
+# Server, die denselben Song innerhalb von SHARED_SOURCE_WINDOW Sekunden starten, teilen sich eine ffmpeg-Pipeline
+SHARED_SOURCES = os.getenv("SHARED_SOURCES", "0") == "1"
+SHARED_SOURCE_WINDOW = float(os.getenv("SHARED_SOURCE_WINDOW", "60"))
+SHARED_SOURCE_MAX_LAG = 10 * 60  # weiter zurückliegende Zuhörer springen nach vorne
+# Lautheitsausgleich (standardmäßig aus): jeder vorausgeladene Song wird einmal im Hintergrund
+# vermessen (EBU R128), beim Abspielen wird nur noch die gespeicherte Verstärkung angewendet.
+# Kostet im Opus-Modus das -c:a copy: Songs mit gespeicherter Verstärkung werden wieder mit
+# libopus umkodiert (mehr CPU, eine zusätzliche verlustbehaftete Kodierung). Noch nicht
+# vermessene Opus-Songs bleiben unverändert, loudnorm schätzt nur, wo ohnehin kodiert wird.
+LOUDNESS_NORMALIZATION = os.getenv("LOUDNESS_NORMALIZATION", "0") == "1"
+LOUDNESS_TARGET = float(os.getenv("LOUDNESS_TARGET", "-16"))  # LUFS
+LOUDNESS_TRUE_PEAK = -1.5  # dBTP
+LOUDNESS_MAX_GAIN = 12  # dB, z.B. für fast stille Songs
+LOUDNESS_TOLERANCE = 0.5  # kleinere Korrekturen lohnen das Umkodieren nicht
+LOUDNESS_WORKERS = int(os.getenv("LOUDNESS_WORKERS", "1"))
+LOUDNESS_TIMEOUT = 5 * 60
+LOUDNESS_TTL = 180 * 24 * 60 * 60
+PREWARM_SECONDS = float(os.getenv("PREWARM_SECONDS", "10"))  # so früh vor Songende startet ffmpeg für den nächsten Song
+
 MAX_PREV_SONGS_SIZE = 500
+MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", "10000"))
+# Seitengröße und Zeilenbreite der Wiedergabeliste (/queue)
+QUEUE_PAGE_SIZE = 15
+QUEUE_LINE_WIDTH = 35
+# Nach so vielen Sekunden ohne Wiedergabe wird der Sprachkanal verlassen, nach IDLE_EVICT_SECONDS
+# ohne Interaktion wird der Zustand des Servers ausgelagert (Schnappschuss, siehe ensure_restored)
+IDLE_DISCONNECT_SECONDS = float(os.getenv("IDLE_DISCONNECT_SECONDS", "300"))
+IDLE_EVICT_SECONDS = float(os.getenv("IDLE_EVICT_SECONDS", str(6 * 60 * 60)))
+REAPER_INTERVAL = 30
+FFMPEG_ORPHAN_GRACE = 60  # so alt muss ein ffmpeg-Prozess ohne Quelle sein, bevor er beendet wird
+# Prometheus-Endpunkt (nur lokal erreichbar), Port 0 schaltet ihn ab
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+LOOP_LAG_INTERVAL = 0.5  # so oft wird die Verzögerung des Event-Loops gemessen
 
 
 # --- Helferfunktionen ---
-@ttl_cache(ttl=24 * 60 * 60)  # 24h
-def get_info(query: str):
-    """Sucht nach einem Song auf YouTube und gibt die Metadaten zurück."""
-    try:
-        search_query = f"ytsearch:{query}" if not query.lower().startswith("https://") else query
-        print("getting new url")
-        with yt_dlp.YoutubeDL(YDL_OPTIONS) as ydl:
-            info = ydl.extract_info(search_query, download=False)
-        if 'entries' in info:
-            info = info['entries'][0]
-        return info
-    except Exception as e:
-        print(f"Fehler bei yt-dlp: {e}")
+yt_dlp = None
+yt_dlp_lock = threading.Lock()
+
+
+def load_yt_dlp():
+    """Importiert yt-dlp samt Plugins erst bei der ersten Verwendung, der Import allein dauert
+    etwa eine Sekunde. Nach dem Login wird er im Hintergrund vorgezogen (siehe on_ready)."""
+    global yt_dlp
+    if yt_dlp is None:
+        with yt_dlp_lock:
+            if yt_dlp is None:
+                import yt_dlp as module
+                import yt_dlp_plugins
+                for options in (YDL_OPTIONS, YDL_SEARCH_OPTIONS):
+                    options["plugin_dirs"] = yt_dlp_plugins.__path__
+                yt_dlp = module
+    return yt_dlp
+
+
+stream_urls = TLRUCache(maxsize=10_000, ttu=lambda key, value, now: value[1], timer=time.time)
+stream_urls_lock = threading.Lock()
+stream_url_stats = {"hits": 0, "refreshes": 0}
+
+
+def stream_expiry(url: str):
+    """Liest den Ablaufzeitpunkt (expire=) einer Stream-URL aus. Lokale Dateien laufen nie ab."""
+    if not url or not url.startswith("http"):
         return None
+    params = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    try:
+        return float(params["expire"][0])
+    except (KeyError, ValueError):
+        return time.time() + STREAM_URL_DEFAULT_TTL
 
-@cached(ttl=24 * 60 * 60)
-async def get_songs(interaction: discord.Interaction, query: str) -> list[app_commands.Choice]:
-    command = [
-        'yt-dlp',
-        '--flat-playlist',
-        '--source-address', '0.0.0.0',
-        '--default-search', 'ytsearch10',
-        '--print', '%(title)s|||%(webpage_url)s',
-        query
-    ]
 
-    process = await asyncio.create_subprocess_exec(
-        *command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
+def remember_stream(query: str, info: dict):
+    """Merkt sich die kurzlebige Stream-URL getrennt von den 24h gecachten Metadaten."""
+    url = info.get("url")
+    expires = stream_expiry(url)
+    if expires is None:
+        return
+    with stream_urls_lock:
+        for key in {query, info.get("webpage_url")}:
+            if key:
+                stream_urls[key] = (url, expires, info.get("acodec"))
 
-    stdout, stderr = await process.communicate()
 
-    if process.returncode != 0:
-        print(f"Fehler im yt-dlp CLI-Aufruf: {stderr.decode()}")
-        return []
+INFO_KEYS = ("url", "webpage_url", "title", "alt_title", "fulltitle", "artist", "creator", "uploader", "channel",
+             "duration", "duration_string", "acodec")
 
-    output_lines = stdout.decode().strip().split('\n')
 
-    song_tuples = []
-    for line in output_lines:
-        if '|||' in line:
-            title, url = line.split('|||', 1)
-            song_tuples.append((title.strip(), url.strip()))
+def slim_info(info: dict) -> dict:
+    """Behält von den riesigen yt-dlp-Metadaten nur, was minimize_info braucht."""
+    return {key: info[key] for key in INFO_KEYS if info.get(key) is not None}
 
+
+def extract_info(query: str) -> dict:
+    """Fragt yt-dlp ohne Cache ab. Fehler werden weitergereicht, damit sie klassifiziert werden können."""
+    search_query = f"ytsearch:{query}" if not query.lower().startswith("https://") else query
+    try:
+        with load_yt_dlp().YoutubeDL(YDL_OPTIONS) as ydl:
+            info = ydl.extract_info(search_query, download=False)
+    except Exception as e:
+        rate_limiter.report_error(e)
+        raise
+    rate_limiter.report_success()
+    if 'entries' in info:
+        if not info['entries']:
+            raise LookupError(f"Keine Suchergebnisse für {query}")
+        info = info['entries'][0]
+    remember_stream(query, info)
+    return slim_info(info)
+
+async def get_songs(interaction: discord.Interaction, query: str) -> list[app_commands.Choice]:
+    song_tuples = await search_cache.search(interaction, "song", query, lambda q: f"ytsearch10:{q}")
     choices = [app_commands.Choice(name=i[0], value=i[1]) for i in song_tuples]
 
     return choices
 
 
-@ttl_cache(ttl=24 * 60 * 60)  # 24h
-def get_playlist_info(query: str):
-    """Holt sich die Infos für eine Playlist oder einen einzelnen Song und gibt immer eine Liste zurück."""
+def extract_playlist_info(query: str):
+    """Holt sich die Infos für eine Playlist und gibt (Name, flache Einträge) zurück."""
     playlist_ydl_options = {'format': 'bestaudio', 'extract_flat': True, 'quiet': True}
+    search_query = f"ytsearch:{query}" if not query.lower().startswith("https://") else query
     try:
-        search_query = f"ytsearch:{query}" if not query.lower().startswith("https://") else query
-        with yt_dlp.YoutubeDL(playlist_ydl_options) as ydl:
+        with load_yt_dlp().YoutubeDL(playlist_ydl_options) as ydl:
             info = ydl.extract_info(search_query, download=False)
-
-        if 'entries' in info:
-            title = info.get('title', "")
-            channel = info.get('channel', "")
-            # Es ist eine Playlist, gib die Liste der Video-Infos zurück
-            return (f"{title if title else ''}{' - ' if title and channel else ''}{channel if channel else ''}",
-                    info['entries'])
-        return None
     except Exception as e:
-        print(f"Fehler beim Abrufen der Playlist-Info: {e}")
-        return None
+        rate_limiter.report_error(e)
+        raise
+    rate_limiter.report_success()
 
+    if 'entries' in info:
+        title = info.get('title', "")
+        channel = info.get('channel', "")
+        # Es ist eine Playlist, gib die Liste der Video-Infos zurück
+        return (f"{title if title else ''}{' - ' if title and channel else ''}{channel if channel else ''}",
+                [slim_info(entry) for entry in info['entries'] if entry])
+    return None
 
-async def get_playlists(interaction: discord.Interaction, query: str) -> list[app_commands.Choice]:
+
+def playlist_search_url(query: str) -> str:
     encoded_query = urllib.parse.quote_plus(query)
     playlist_filter = "EgIQAw%3D%3D"
-    search_url = f"https://www.youtube.com/results?search_query={encoded_query}&sp={playlist_filter}"
-    command = [
-        'yt-dlp',
-        '--flat-playlist',
-        '--source-address', '0.0.0.0',
-        '--print', '%(title)s|||%(webpage_url)s',
-        '--playlist-items', '1:10',
-        search_url
-    ]
-
-    process = await asyncio.create_subprocess_exec(
-        *command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
+    return f"https://www.youtube.com/results?search_query={encoded_query}&sp={playlist_filter}"
 
-    stdout, stderr = await process.communicate()
-
-    if process.returncode != 0:
-        print(f"Fehler im yt-dlp CLI-Aufruf: {stderr.decode()}")
-        return []
-
-    output_lines = stdout.decode().strip().split('\n')
-
-    album_tuples = []
-    for line in output_lines:
-        if '|||' in line:
-            title, url = line.split('|||', 1)
-            album_tuples.append((title.strip(), url.strip()))
 
+async def get_playlists(interaction: discord.Interaction, query: str) -> list[app_commands.Choice]:
+    album_tuples = await search_cache.search(interaction, "playlist", query, playlist_search_url)
     choices = [app_commands.Choice(name=i[0], value=i[1]) for i in album_tuples]
 
     return choices
 
 
-def minimize_info(info: dict) -> dict:
+def format_duration(seconds) -> str:
+    """Formatiert eine Dauer in Sekunden wie yt-dlp als [h:]mm:ss."""
+    if not seconds:
+        return ""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+@dataclass(slots=True, eq=False, weakref_slot=True)
+class Track:
+    """Ein Song in der Warteschlange oder im Verlauf.
+
+    url ist die abspielbare Stream-URL und darf fehlen (None), solange webpage_url gesetzt
+    ist. Dann wird sie erst kurz vor dem Abspielen aufgelöst. expires ist der
+    Ablaufzeitpunkt der Stream-URL (None für lokale Dateien), acodec ihr Audio-Codec.
+    loudness wird von der LoudnessAnalyzer gesetzt, sobald der Song vermessen ist.
+    eq=False: Derselbe Song kann mehrfach in der Warteschlange stehen und jeder Eintrag
+    ist ein eigenes Objekt.
+    """
+    webpage_url: str
+    title: str
+    artist: str
+    duration: float = None
+    duration_string: str = ""
+    url: str = None
+    expires: float = None
+    acodec: str = None
+    loudness: list = None  # [LUFS, True Peak] aus der Lautheitsanalyse
+    label_cache: str = field(default=None, repr=False)
+
+    def label(self) -> str:
+        """Gekürzte Anzeige "Titel - Künstler" für die Wiedergabeliste, einmal berechnet."""
+        if self.label_cache is None:
+            self.label_cache = f"{self.title} - {self.artist}"[:QUEUE_LINE_WIDTH - 3]
+        return self.label_cache
+
+
+def minimize_info(info: dict) -> Track:
     """Reduziert die große Menge an Metadaten auf das Nötigste."""
     url: str = info.get("url")
+    webpage_url: str = info.get("webpage_url") or url
     title: str =  info.get("title") or info.get("alt_title") or info.get("fulltitle", "")
-    artist: str = info.get("artist") or info.get("creator") or info.get("uploader", "")
-    duration_string: str =  info.get("duration_string", "")
+    artist: str = info.get("artist") or info.get("creator") or info.get("uploader") or info.get("channel", "")
+    duration_string: str =  info.get("duration_string") or format_duration(info.get("duration"))
 
     if title and artist:
         title = title.replace(artist, "")
@@ -163,55 +306,2411 @@ def minimize_info(info: dict) -> dict:
             title = title.replace("-", "")
             title = title.strip()
 
+    return Track(
+        webpage_url=webpage_url,
+        title=title,
+        artist=artist,
+        duration=info.get("duration"),
+        duration_string=duration_string,
+        url=url,
+        expires=stream_expiry(url),
+        acodec=info.get("acodec"),
+    )
+
+
+def minimize_flat_entry(entry: dict) -> Track:
+    """Baut aus einem flachen Playlist-Eintrag (extract_flat) einen noch nicht aufgelösten Song."""
+    return minimize_info({**entry, "url": None, "webpage_url": entry.get("url")})
+
+
+# --- Zustand pro Server ---
+class GuildPlayer:
+    """Warteschlange, Verlauf und Wiedergabezustand eines Servers.
+
+    Die Warteschlange ist eine deque (O(1) an beiden Enden), der Verlauf ein Ringpuffer
+    mit fester Größe. Der zuletzt angehängte Song im Verlauf ist der aktuelle Song.
+    """
+
+    def __init__(self):
+        self.queue: deque[Track] = deque()
+        self.history: deque[Track] = deque(maxlen=MAX_PREV_SONGS_SIZE)
+        self.loop = False
+        self.now_playing_message = None
+        self.now_playing_updater = None
+        self.controls_view = None
+        self.prewarmed = None  # (Track, MeasuredSource)
+        self.track_ended = None
+        self.snapshot_fingerprint = None
+        self.last_active = time.monotonic()
+        self.stopping = False  # verhindert, dass der after-Callback beim Trennen den nächsten Song startet
+        self.rewound = False  # disconnect_idle hat den angehaltenen Song schon zurückgelegt
+
+    @property
+    def current(self):
+        return self.history[-1] if self.history else None
+
+    def free_slots(self) -> int:
+        return max(0, MAX_QUEUE_SIZE - len(self.queue))
+
+    def has_next(self) -> bool:
+        return bool(self.queue) or (self.loop and bool(self.history))
+
+    def upcoming(self, count: int) -> list[Track]:
+        """Die nächsten count Songs in Abspielreihenfolge."""
+        if self.loop and self.history:
+            return [self.history[-1]]
+        return list(itertools.islice(self.queue, count))
+
+    def step_back(self):
+        """Legt den aktuellen Song zurück an den Anfang der Warteschlange."""
+        self.queue.appendleft(self.history.pop())
+
+    def clear(self):
+        self.queue.clear()
+        self.history.clear()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def compact(self) -> int:
+        """Verwirft aufgelöste Stream-URLs und Anzeigetexte, die erst wieder beim Abspielen
+        gebraucht werden. Gibt die ungefähr freigegebenen Bytes zurück."""
+        before = self.memory_usage()
+        keep = {id(track) for track in self.upcoming(PREFETCH_AHEAD)}
+        for track in itertools.chain(self.history, self.queue):
+            if id(track) in keep:
+                continue
+            if track.url and track.url.startswith("http") and not is_discord_attachment(track.url):
+                track.url = track.expires = None
+            track.label_cache = None
+        return before - self.memory_usage()
+
+    def memory_usage(self) -> int:
+        """Grobe Schätzung in Bytes: Deques, Track-Objekte und deren Strings."""
+        size = sys.getsizeof(self) + sys.getsizeof(self.queue) + sys.getsizeof(self.history)
+        for track in itertools.chain(self.queue, self.history):
+            size += sys.getsizeof(track)
+            for value in (track.webpage_url, track.title, track.artist, track.duration_string, track.url, track.label_cache):
+                if value is not None:
+                    size += sys.getsizeof(value)
+        return size
+
+    def fingerprint(self) -> tuple:
+        """Billiger Vergleichswert, um unveränderte Server beim Schnappschuss zu überspringen."""
+        return (len(self.queue), len(self.history), self.loop,
+                id(self.queue[0]) if self.queue else None, id(self.queue[-1]) if self.queue else None,
+                id(self.history[-1]) if self.history else None)
+
+
+guild_players: dict[int, GuildPlayer] = {}
+
+
+def get_player(guild_id: int) -> GuildPlayer:
+    player = guild_players.get(guild_id)
+    if player is None:
+        player = guild_players[guild_id] = GuildPlayer()
+    return player
+
+
+def render_queue_page(player: GuildPlayer, start: int, page_size: int = QUEUE_PAGE_SIZE) -> tuple[str, int]:
+    """Rendert eine Seite der Wiedergabeliste in chronologischer Reihenfolge.
+
+    Verlauf und Warteschlange bilden zusammen eine durchgehende Liste, deren Einträge
+    1-basiert nummeriert sind; der aktuelle Song ist mit ▶ markiert. Gibt den Text und
+    den (an die aktuelle Länge angepassten) Startindex zurück.
+    """
+    history_len = len(player.history)
+    total = history_len + len(player.queue)
+    if not total:
+        return "Die Wiedergabeliste ist leer", 0
+    start = max(0, min(start, total - 1))
+    end = min(total, start + page_size)
+
+    lines = [f"**Wiedergabeliste** · Songs {start + 1}–{end} von {total}"]
+    for index in range(start, end):
+        if index < history_len:
+            track = player.history[index]
+            marker = "▶" if index == history_len - 1 else "-"
+        else:
+            track = player.queue[index - history_len]
+            marker = "-"
+        lines.append(f"{marker} {index + 1}. {track.label()}")
+    return "\n".join(lines), start
+
+
+# --- Metriken ---
+class Histogram:
+    """Histogramm mit festen Bucket-Grenzen im Prometheus-Format.
+
+    observe() kostet nur eine binäre Suche und ein paar Additionen und kann deshalb auch
+    im Player-Thread und in den yt-dlp-Workern dauerhaft mitlaufen. Optional wird nach
+    einem Label (z.B. dem Namen des Pools) aufgeteilt.
+    """
+
+    def __init__(self, name: str, help_text: str, buckets: tuple, label: str = None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        self.series = {}  # Labelwert -> [Zähler pro Bucket (nicht kumuliert), Summe, Anzahl]
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, label_value: str = None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, label_value: str = None) -> int:
+        series = self.series.get(label_value)
+        return series[2] if series else 0
+
+    def quantile(self, q: float, label_value: str = None) -> float:
+        """Schätzt das q-Quantil (0-1) wie histogram_quantile() durch lineare Interpolation im Bucket."""
+        series = self.series.get(label_value)
+        if not series or not series[2]:
+            return 0.0
+        rank = q * series[2]
+        seen = 0
+        for index, count in enumerate(series[0]):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = [(label_value, list(counts), total, count) for label_value, (counts, total, count) in self.series.items()]
+        for label_value, counts, total, count in snapshot:
+            prefix = f'{self.label}="{label_value}",' if self.label else ""
+            labels = f"{{{prefix[:-1]}}}" if prefix else ""
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Sammelt Histogramme und Collector-Funktionen.
+
+    Zähler und Füllstände werden nicht bei jedem Ereignis gepflegt, sondern erst beim
+    Abruf aus den stats() der einzelnen Komponenten gelesen. Ein Collector gibt
+    (Name, Typ, Hilfetext, [(Labels, Wert), ...]) zurück.
+    """
+
+    def __init__(self):
+        self.histograms = []
+        self.collectors = []
+
+    def histogram(self, name: str, help_text: str, buckets: tuple, label: str = None) -> Histogram:
+        histogram = Histogram(name, help_text, buckets, label)
+        self.histograms.append(histogram)
+        return histogram
+
+    def collector(self, func):
+        self.collectors.append(func)
+        return func
+
+    def samples(self):
+        for func in self.collectors:
+            try:
+                yield from func()
+            except Exception as e:
+                print(f"Fehler beim Erfassen der Metriken ({func.__name__}): {e}")
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.render())
+        for name, kind, help_text, values in self.samples():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values:
+                label_text = ",".join(f'{key}="{value_}"' for key, value_ in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 30)
+GAP_BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+metrics = MetricsRegistry()
+extraction_latency = metrics.histogram(
+    "musicbot_extraction_seconds", "Dauer einer yt-dlp-Auflösung inklusive Wartezeit im Pool", LATENCY_BUCKETS, label="pool")
+extraction_wait = metrics.histogram(
+    "musicbot_extraction_wait_seconds", "Wartezeit bis ein Worker frei ist", LATENCY_BUCKETS, label="pool")
+autocomplete_latency = metrics.histogram(
+    "musicbot_autocomplete_seconds", "Dauer einer Suche für die Autovervollständigung", LATENCY_BUCKETS)
+track_gap = metrics.histogram(
+    "musicbot_track_gap_seconds", "Stille zwischen dem Ende eines Songs und dem ersten Frame des nächsten", GAP_BUCKETS, label="start")
+loop_lag = metrics.histogram(
+    "musicbot_event_loop_lag_seconds", "Verspätung des Event-Loops gegenüber einem festen Timer", LAG_BUCKETS)
+
+
+async def monitor_event_loop_lag():
+    """Misst, wie viel später als geplant ein kurzer Timer feuert."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        loop_lag.observe(max(0.0, loop.time() - expected))
+
+
+def child_processes(name: str) -> list[tuple[int, float]]:
+    """Gibt (PID, Alter in Sekunden) der direkten Kindprozesse mit dem Namen name zurück (Linux, über /proc)."""
+    own_pid = os.getpid()
+    children = []
+    try:
+        pids = [entry for entry in os.listdir("/proc") if entry.isdigit()]
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except OSError:
+        return []
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                head, rest = f.read().rsplit(")", 1)
+        except OSError:
+            continue
+        fields = rest.split()
+        if head.split("(", 1)[1] == name and int(fields[1]) == own_pid:
+            children.append((int(pid), uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")))
+    return children
+
+
+def count_child_processes(name: str) -> int:
+    return len(child_processes(name))
+
+
+def process_uptime() -> float:
+    """Sekunden seit dem Start dieses Prozesses (Linux), sonst seit dem Import von bot.py."""
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return time.perf_counter() - MODULE_LOADED
+
+
+startup_times = {}  # Phase -> Sekunden seit Prozessstart
+
+
+async def serve_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server():
+    """Startet den Prometheus-Endpunkt /metrics. Gibt den Runner zum Beenden zurück."""
+    if not METRICS_PORT:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", serve_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    except OSError as e:
+        print(f"Konnte Metrik-Endpunkt auf {METRICS_HOST}:{METRICS_PORT} nicht starten: {e}")
+        await runner.cleanup()
+        return None
+    print(f"Metriken unter http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return runner
+
+
+# --- Globales Rate-Limit für YouTube ---
+PRIORITY_INTERACTIVE = 0
+PRIORITY_AUTOCOMPLETE = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interaktiv", PRIORITY_AUTOCOMPLETE: "Suche", PRIORITY_BACKGROUND: "Hintergrund"}
+
+THROTTLE_MARKERS = ("http error 429", "too many requests", "confirm you're not a bot", "confirm you’re not a bot", "rate-limited")
+
+def is_throttle_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(marker in message for marker in THROTTLE_MARKERS)
+
+
+class AdaptiveRateLimiter:
+    """Prozessweiter Token-Bucket mit AIMD-Anpassung für alle Anfragen an YouTube.
+
+    Jede erfolgreiche Antwort erhöht die Rate leicht (additiv), ein HTTP 429 oder eine
+    Bot-Prüfung halbiert sie (multiplikativ). Wartende Anfragen werden nach Priorität
+    bedient, sodass ein /play nicht hinter dem Vorausladen eines Albums ansteht.
+    """
+
+    ADDITIVE_STEP = 0.05
+    DECREASE_FACTOR = 0.5
+    WINDOW = 60
+
+    def __init__(self, rate: float, min_rate: float, max_rate: float, burst: float):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.waiters = []
+        self.counter = itertools.count()
+        self.wakeup = None
+        self.lock = threading.Lock()
+        self.granted = deque()
+        self.throttle_events = 0
+        self.last_throttle = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _grant(self):
+        """Verteilt vorhandene Tokens an die wartenden Anfragen mit der höchsten Priorität."""
+        self._refill()
+        while self.waiters and self.tokens >= 1:
+            _, _, future = heapq.heappop(self.waiters)
+            if future.done():
+                continue
+            self.tokens -= 1
+            self.granted.append(time.monotonic())
+            future.set_result(True)
+        if self.waiters and (self.wakeup is None or self.wakeup.cancelled()):
+            delay = (1 - self.tokens) / self.rate
+            self.wakeup = asyncio.get_running_loop().call_later(delay, self._on_wakeup)
+
+    def _on_wakeup(self):
+        self.wakeup = None
+        self._grant()
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE, timeout: float = None) -> bool:
+        """Wartet auf ein Token. Gibt False zurück, wenn timeout vorher abläuft."""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), future))
+        self._grant()
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+
+    def report_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.ADDITIVE_STEP)
+
+    def report_error(self, error: Exception):
+        if not is_throttle_error(error):
+            return
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate * self.DECREASE_FACTOR)
+            self.tokens = min(self.tokens, 0)
+            self.throttle_events += 1
+            self.last_throttle = time.time()
+        print(f"YouTube drosselt Anfragen, senke Rate auf {self.rate:.2f}/s")
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        while self.granted and now - self.granted[0] > self.WINDOW:
+            self.granted.popleft()
+        used = len(self.granted) / self.WINDOW
+        waiting = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self.waiters:
+            if not future.done():
+                waiting[PRIORITY_NAMES[priority]] += 1
+        return {
+            "rate": self.rate,
+            "max_rate": self.max_rate,
+            "tokens": max(0.0, self.tokens),
+            "used": used,
+            "headroom": max(0.0, self.rate - used),
+            "waiting": waiting,
+            "throttle_events": self.throttle_events,
+            "last_throttle": self.last_throttle,
+        }
+
+
+rate_limiter = AdaptiveRateLimiter(RATE_LIMIT_INITIAL, RATE_LIMIT_MIN, RATE_LIMIT_MAX, RATE_LIMIT_BURST)
+
+
+# --- Nicht blockierende Auflösung von Songs ---
+class ExtractionEngine:
+    """Führt die blockierenden yt-dlp-Aufrufe in einem begrenzten Thread-Pool aus.
+
+    Der Event-Loop wartet nur noch auf das Ergebnis, sodass Heartbeats, Buttons und
+    "after"-Callbacks anderer Server weiterlaufen, während eine Suche hängt.
+    Die Ergebnisse werden in info_cache und playlist_cache gecacht (siehe ResolveCache).
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="yt-dlp")
+        self.pending = 0
+        self.completed = 0
+
+    async def run(self, func, *args, priority: int = PRIORITY_INTERACTIVE):
+        """Führt func(*args) im Pool aus und misst Wartezeit und Gesamtdauer.
+
+        Das Token des Rate-Limits wird vorher auf dem Event-Loop geholt, damit wartende
+        Hintergrund-Jobs keine Worker belegen und ein /play nicht hinter ihnen ansteht.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self.pending += 1
+        try:
+            await rate_limiter.acquire(priority)
+            submitted = time.perf_counter()
+
+            def job():
+                extraction_wait.observe(time.perf_counter() - submitted, self.name)
+                return func(*args)
+
+            return await loop.run_in_executor(self.executor, job)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            extraction_latency.observe(time.perf_counter() - started, self.name)
+
+    async def get_info(self, query: str, priority: int = PRIORITY_INTERACTIVE):
+        """Sucht nach einem Song auf YouTube und gibt die Metadaten zurück (24h gecacht).
+
+        Achtung: Die enthaltene "url" kann bei einem Cache-Treffer bereits abgelaufen sein,
+        zum Abspielen get_stream_url() verwenden.
+        """
+        return await info_cache.resolve(query, lambda: self.run(extract_info, query, priority=priority))
+
+    async def get_playlist_info(self, query: str, priority: int = PRIORITY_INTERACTIVE):
+        return await playlist_cache.resolve(query, lambda: self.run(extract_playlist_info, query, priority=priority))
+
+    async def get_stream_url(self, webpage_url: str, priority: int = PRIORITY_INTERACTIVE):
+        """Gibt (url, expires, acodec) einer noch ausreichend lange gültigen Stream-URL zurück
+        und löst sie nur dann neu auf, wenn sie fehlt oder bald abläuft."""
+        with stream_urls_lock:
+            cached = stream_urls.get(webpage_url)
+        if cached and cached[1] - STREAM_URL_MARGIN > time.time():
+            stream_url_stats["hits"] += 1
+            return cached
+        stream_url_stats["refreshes"] += 1
+        info = await stream_cache.resolve(webpage_url, lambda: self.run(extract_info, webpage_url, priority=priority))
+        if not info:
+            return None
+        return info.get("url"), stream_expiry(info.get("url")), info.get("acodec")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "running": min(self.pending, self.max_workers),
+            "queued": max(0, self.pending - self.max_workers),
+            "completed": self.completed,
+            "wait_p50": extraction_wait.quantile(0.5, self.name),
+            "latency_p50": extraction_latency.quantile(0.5, self.name),
+            "latency_p99": extraction_latency.quantile(0.99, self.name),
+        }
+
+
+extraction_engine = ExtractionEngine("extract", EXTRACTOR_WORKERS)
+
+
+# --- Vorgewärmte Worker für die Autovervollständigung ---
+_search_ydl = None
+
+
+def init_search_worker():
+    """Läuft einmal pro Worker-Prozess: yt-dlp wird nur hier importiert und initialisiert."""
+    global _search_ydl
+    _search_ydl = load_yt_dlp().YoutubeDL(YDL_SEARCH_OPTIONS)
+
+
+def search_worker(search_query: str) -> list[tuple[str, str]]:
+    """Führt eine flache Suche im Worker-Prozess aus und gibt (Titel, URL)-Paare zurück."""
+    info = _search_ydl.extract_info(search_query, download=False)
+
+    results = []
+    for entry in (info or {}).get("entries") or []:
+        if not entry:
+            continue
+        title = entry.get("title")
+        url = entry.get("webpage_url") or entry.get("url")
+        if title and url:
+            results.append((title.strip(), url.strip()))
+    return results
+
+
+class AutocompleteSearchPool:
+    """Hält dauerhaft laufende yt-dlp-Prozesse für Suchanfragen bereit.
+
+    Statt für jeden Tastendruck einen neuen yt-dlp-Prozess zu starten, werden die Jobs
+    über die Queue eines ProcessPoolExecutor an vorgewärmte Worker verteilt. Wird die
+    wartende Coroutine abgebrochen, wird auch der noch nicht gestartete Job verworfen.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.executor = None
+
+    def start(self):
+        """Startet die Worker. Muss vor client.run() aufgerufen werden, solange noch keine Threads laufen."""
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_search_worker)
+            for _ in range(self.max_workers):
+                self.executor.submit(int)
+
+    async def search(self, search_query: str) -> list[tuple[str, str]]:
+        self.start()
+        start = time.perf_counter()
+        # Die Autovervollständigung muss innerhalb von 3 Sekunden antworten
+        if not await rate_limiter.acquire(PRIORITY_AUTOCOMPLETE, timeout=2):
+            return []
+        try:
+            future = self.executor.submit(search_worker, search_query)
+            result = await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            print("Autovervollständigungs-Worker abgestürzt, starte beim nächsten Aufruf neu.")
+            self.executor = None
+            return []
+        except Exception as e:
+            print(f"Fehler bei der yt-dlp-Suche: {e}")
+            rate_limiter.report_error(e)
+            return []
+        rate_limiter.report_success()
+        autocomplete_latency.observe(time.perf_counter() - start)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "latency_p50": autocomplete_latency.quantile(0.5),
+            "latency_p99": autocomplete_latency.quantile(0.99),
+        }
+
+
+autocomplete_pool = AutocompleteSearchPool(AUTOCOMPLETE_WORKERS)
+
+
+# --- Persistenter Metadaten-Speicher ---
+class MetadataStore:
+    """SQLite-Datenbank (WAL) hinter den Caches, damit sie einen Neustart überleben.
+
+    Alle Zugriffe laufen über einen eigenen Thread, der Event-Loop wartet nur auf das
+    Ergebnis. Schreibzugriffe werden nicht abgewartet. Abgelaufene Einträge und alles über
+    max_rows (am längsten nicht gelesen zuerst) werden regelmäßig im Hintergrund gelöscht.
+    """
+
+    def __init__(self, path: str, max_rows: int):
+        self.path = path
+        self.max_rows = max_rows
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self.db = None
+        self.hits = {}
+        self.misses = {}
+        self.warmup_reported = False
+
+    def _open(self) -> dict:
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL, "
+            "PRIMARY KEY (kind, key)) WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS guild_snapshots (guild_id INTEGER PRIMARY KEY, data BLOB NOT NULL, updated REAL NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        rows = self.db.execute("SELECT kind, COUNT(*) FROM cache WHERE expires > ? GROUP BY kind", (time.time(),))
+        return dict(rows.fetchall())
+
+    def open(self):
+        """Öffnet die Datenbank beim Start und meldet, wie viele Einträge den Neustart überlebt haben."""
+        try:
+            counts = self.executor.submit(self._open).result()
+        except sqlite3.Error as e:
+            print(f"Konnte Metadaten-Datenbank {self.path} nicht öffnen, starte ohne: {e}")
+            self.db = None
+            return
+        summary = ", ".join(f"{count} {kind}" for kind, count in counts.items()) or "leer"
+        print(f"Metadaten-Datenbank geladen (Warmstart): {summary}")
+
+    def _get(self, kind: str, key: str):
+        row = self.db.execute("SELECT value FROM cache WHERE kind = ? AND key = ? AND expires > ?",
+                              (kind, key, time.time())).fetchone()
+        if row is None:
+            return None
+        self.db.execute("UPDATE cache SET accessed = ? WHERE kind = ? AND key = ?", (time.time(), kind, key))
+        return json.loads(row[0])
+
+    def _put(self, kind: str, key: str, value: str, ttl: float):
+        now = time.time()
+        self.db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)", (kind, key, value, now + ttl, now))
+
+    def _get_setting(self, key: str):
+        row = self.db.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_setting(self, key: str, value: str):
+        self.db.execute("INSERT OR REPLACE INTO settings VALUES (?, ?)", (key, value))
+
+    async def get_setting(self, key: str):
+        if self.db is None:
+            return None
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self._get_setting, key)
+        except sqlite3.Error as e:
+            print(f"Fehler beim Lesen aus der Metadaten-Datenbank: {e}")
+            return None
+
+    async def set_setting(self, key: str, value: str):
+        if self.db is None:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._set_setting, key, value)
+        except sqlite3.Error as e:
+            print(f"Fehler beim Schreiben in die Metadaten-Datenbank: {e}")
+
+    def _load_snapshot(self, guild_id: int):
+        row = self.db.execute("SELECT data FROM guild_snapshots WHERE guild_id = ?", (guild_id,)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def _save_snapshots(self, snapshots: list[tuple[int, list]]):
+        now = time.time()
+        with self.db:
+            for guild_id, data in snapshots:
+                if data is None:
+                    self.db.execute("DELETE FROM guild_snapshots WHERE guild_id = ?", (guild_id,))
+                else:
+                    blob = zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+                    self.db.execute("INSERT OR REPLACE INTO guild_snapshots VALUES (?, ?, ?)", (guild_id, blob, now))
+
+    async def load_snapshot(self, guild_id: int):
+        if self.db is None:
+            return None
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self._load_snapshot, guild_id)
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            print(f"Konnte Schnappschuss von Server {guild_id} nicht laden: {e}")
+            return None
+
+    async def save_snapshots(self, snapshots: list[tuple[int, list]]) -> bool:
+        """Gibt zurück, ob die Schnappschüsse gespeichert wurden."""
+        if self.db is None:
+            return False
+        if not snapshots:
+            return True
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._save_snapshots, snapshots)
+        except sqlite3.Error as e:
+            print(f"Konnte Schnappschüsse nicht speichern: {e}")
+            return False
+        return True
+
+    def _compact(self) -> tuple[int, int]:
+        now = time.time()
+        expired = self.db.execute("DELETE FROM cache WHERE expires <= ?", (now,)).rowcount
+        total = self.db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        evicted = 0
+        if total > self.max_rows:
+            evicted = self.db.execute(
+                "DELETE FROM cache WHERE (kind, key) IN (SELECT kind, key FROM cache ORDER BY accessed LIMIT ?)",
+                (total - self.max_rows,)).rowcount
+        self.db.execute("PRAGMA incremental_vacuum")
+        self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return expired, evicted
+
+    async def get(self, kind: str, key):
+        if self.db is None:
+            return None
+        try:
+            value = await asyncio.get_running_loop().run_in_executor(self.executor, self._get, kind, json.dumps(key))
+        except sqlite3.Error as e:
+            print(f"Fehler beim Lesen aus der Metadaten-Datenbank: {e}")
+            return None
+        counter = self.hits if value is not None else self.misses
+        counter[kind] = counter.get(kind, 0) + 1
+        if not self.warmup_reported and self.lookups() >= METADATA_DB_WARMUP_LOOKUPS:
+            self.warmup_reported = True
+            print(f"Metadaten-Datenbank nach {self.lookups()} Abfragen (Warmstart): {self.hit_rate_summary()}")
+        return value
+
+    def put(self, kind: str, key, value, ttl: float):
+        if self.db is None:
+            return
+        future = self.executor.submit(self._put, kind, json.dumps(key), json.dumps(value), ttl)
+        future.add_done_callback(lambda f: f.exception() and print(f"Fehler beim Schreiben in die Metadaten-Datenbank: {f.exception()}"))
+
+    async def compact_periodically(self):
+        while self.db is not None:
+            await asyncio.sleep(METADATA_DB_COMPACT_INTERVAL)
+            try:
+                expired, evicted = await asyncio.get_running_loop().run_in_executor(self.executor, self._compact)
+            except sqlite3.Error as e:
+                print(f"Fehler beim Aufräumen der Metadaten-Datenbank: {e}")
+                continue
+            if expired or evicted:
+                print(f"Metadaten-Datenbank aufgeräumt: {expired} abgelaufen, {evicted} verdrängt")
+
+    def lookups(self) -> int:
+        return sum(self.hits.values()) + sum(self.misses.values())
+
+    def hit_rate(self, kind: str) -> float:
+        hits, misses = self.hits.get(kind, 0), self.misses.get(kind, 0)
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    def hit_rate_summary(self) -> str:
+        kinds = sorted(set(self.hits) | set(self.misses))
+        return ", ".join(f"{kind} {self.hit_rate(kind):.0%} ({self.hits.get(kind, 0)})" for kind in kinds) or "keine Abfragen"
+
+
+metadata_store = MetadataStore(METADATA_DB_PATH, METADATA_DB_MAX_ROWS)
+
+
+# --- Schnappschüsse der Warteschlangen ---
+restore_tasks = {}
+
+
+def track_to_row(track: Track) -> list:
+    """Kompakte Darstellung eines Songs ohne die kurzlebige Stream-URL."""
+    return [track.webpage_url, track.title, track.artist, track.duration, track.duration_string]
+
+
+def track_from_row(row: list) -> Track:
+    webpage_url, title, artist, duration, duration_string = row
+    # Hochgeladene Dateien haben keine Webseite, der Pfad ist gleichzeitig die abspielbare URL
+    url = webpage_url if not webpage_url.startswith("http") else None
+    return Track(webpage_url=webpage_url, title=title, artist=artist, duration=duration,
+                 duration_string=duration_string, url=url)
+
+
+def playback_interrupted(guild_id: int, player: GuildPlayer) -> bool:
+    """Ob der aktuelle Song gerade läuft oder angehalten ist, also von einem Neustart unterbrochen würde."""
+    if player.rewound:
+        return False  # nicht ein zweites Mal zurücklegen
+    guild = client.get_guild(guild_id)
+    voice_client = guild.voice_client if guild else None
+    return bool(voice_client and (voice_client.is_playing() or voice_client.is_paused()))
+
+
+def snapshot_player(player: GuildPlayer, interrupted: bool):
+    if not player.queue and not player.history:
+        return None
     return {
-        "url": url,
-        "title": title,
-        "artist": artist,
-        "duration_string": duration_string
+        "queue": [track_to_row(track) for track in player.queue],
+        "history": [track_to_row(track) for track in player.history],
+        "loop": player.loop,
+        "interrupted": interrupted,
     }
 
 
-def format_queue(prev: list[dict], queue: list[dict], max_len: int = 30, max_width: int = 35) -> str:
-    if not prev and not queue:
-        return "Die Wiedergabeliste ist leer"
-    prev: list[str] = [f"{x['title']} - {x['artist']}" for x in prev]
-    prev = [x[:max_width - 3] for x in prev]
+def restore_player(data: dict) -> GuildPlayer:
+    player = GuildPlayer()
+    for key, target in (("history", player.history), ("queue", player.queue)):
+        for row in data[key]:
+            track = track_from_row(row)
+            if track.url and not os.path.isfile(track.url):
+                continue  # hochgeladene Datei existiert nicht mehr
+            if track.url:
+                upload_store.attach(track)
+            target.append(track)
+    player.loop = data["loop"]
+    if data.get("interrupted") and player.history:
+        # Der beim Neustart unterbrochene Song wird von vorne gespielt, ein bereits zu Ende
+        # gespielter bleibt im Verlauf
+        player.step_back()
+    player.snapshot_fingerprint = (player.fingerprint(), False)
+    return player
+
+
+async def snapshot_players():
+    """Speichert alle Server, deren Warteschlange sich seit dem letzten Schnappschuss geändert hat."""
+    snapshots = []
+    for guild_id, player in list(guild_players.items()):
+        interrupted = playback_interrupted(guild_id, player)
+        fingerprint = (player.fingerprint(), interrupted)  # auch speichern, wenn nur der Song zu Ende ist
+        if fingerprint == player.snapshot_fingerprint:
+            continue
+        player.snapshot_fingerprint = fingerprint
+        snapshots.append((guild_id, snapshot_player(player, interrupted)))
+    await metadata_store.save_snapshots(snapshots)
 
-    queue: list[str] = [f"{x['title']} - {x['artist']}" for x in queue]
-    queue = [x[:max_width - 3] for x in queue]
 
-    current = ""
-    if prev:
-        current = prev.pop(-1)
+async def snapshot_periodically():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        await snapshot_players()
 
-    prev = prev[::-1]
 
-    prev_short = prev[:max_len // 3]
-    queue_short = queue[:2 * max_len // 3]
+async def _restore(guild_id: int):
+    data = await metadata_store.load_snapshot(guild_id)
+    if data and guild_id not in guild_players:
+        guild_players[guild_id] = restore_player(data)
+        print(f"Warteschlange von Server {guild_id} wiederhergestellt ({len(data['queue'])} Songs)")
 
-    message = ""
-    if len(prev) != len(prev_short):
-        message += f"... {len(prev) - len(prev_short)} - weitere Songs\n"
-    for element in prev_short:
-        message += f"- {element}\n"
-    if current:
-        message += f"▶ {current}\n"
-    for element in queue_short:
-        message += f"- {element}\n"
 
-    if len(queue) != len(queue_short):
-        message += f"... {len(queue) - len(queue_short)} - weitere Songs\n"
+async def ensure_restored(guild_id: int):
+    """Lädt den Schnappschuss eines Servers erst bei dessen erster Interaktion nach dem Start
+    (oder nachdem reap_idle_guilds ihn ausgelagert hat) und merkt sich die Interaktion."""
+    if guild_id is None:
+        return
+    if guild_id not in guild_players:
+        task = restore_tasks.get(guild_id)
+        if task is None:
+            task = restore_tasks[guild_id] = asyncio.create_task(_restore(guild_id))
+        await task
+        if guild_id not in guild_players:
+            get_player(guild_id)  # kein Schnappschuss vorhanden, nicht bei jeder Interaktion erneut nachsehen
+        restore_tasks.pop(guild_id, None)
+    guild_players[guild_id].touch()
+
+
+# --- Gemeinsamer Cache für Suchergebnisse ---
+def normalize_query(query: str) -> str:
+    """Vereinheitlicht Unicode-Form, Groß-/Kleinschreibung und Leerzeichen einer Suche."""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+class AsyncTTLCache:
+    """Größenbegrenzter TTL/LRU-Cache für Coroutinen mit Single-Flight.
+
+    Gleichzeitige Anfragen nach demselben Schlüssel teilen sich einen einzigen Aufruf
+    von fetch(), statt jeweils eigene yt-dlp-Abfragen zu starten. Ist ein kind angegeben,
+    wird bei einem Fehltreffer zuerst im MetadataStore nachgesehen und jedes neue
+    Ergebnis dort gespeichert.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, kind: str = None):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.kind = kind
+        self.in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.store_hits = 0
+
+    def should_cache(self, value) -> bool:
+        return value is not None
+
+    def on_error(self, key, error: Exception):
+        pass
+
+    async def fetch_through_store(self, key, fetch):
+        if self.kind:
+            value = await metadata_store.get(self.kind, key)
+            if value is not None:
+                self.store_hits += 1
+                return value
+        value = await fetch()
+        if self.kind and self.should_cache(value):
+            metadata_store.put(self.kind, key, value, self.cache.ttl)
+        return value
+
+    def start_fetch(self, key, fetch) -> asyncio.Task:
+        task = self.in_flight.get(key)
+        if task is not None:
+            return task
+
+        task = asyncio.create_task(self.fetch_through_store(key, fetch))
+        self.in_flight[key] = task
+
+        def store(t: asyncio.Task):
+            if self.in_flight.get(key) is t:
+                del self.in_flight[key]
+            if t.cancelled():
+                return
+            if t.exception() is not None:
+                self.on_error(key, t.exception())
+            elif self.should_cache(t.result()):
+                self.remember(key, t.result())
+
+        task.add_done_callback(store)
+        return task
+
+    def remember(self, key, value):
+        self.cache[key] = value
+
+    async def get_or_fetch(self, key, fetch):
+        if key in self.cache:
+            self.hits += 1
+            return self.cache[key]
+        if key in self.in_flight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+        # shield: bricht ein Wartender ab, bekommen die anderen trotzdem ihr Ergebnis
+        return await asyncio.shield(self.start_fetch(key, fetch))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self.cache),
+            "maxsize": self.cache.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "store_hits": self.store_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SearchCache(AsyncTTLCache):
+    """Serverübergreifender Cache für die Autovervollständigung.
+
+    Bei einem Fehltreffer wird sofort mit den Ergebnissen eines bereits gecachten
+    kürzeren oder längeren Präfixes geantwortet, während die echte Suche im
+    Hintergrund den Cache für den nächsten Tastendruck füllt. Tippt ein Nutzer weiter,
+    wird seine veraltete Suche abgebrochen, sofern sonst niemand darauf wartet.
+    """
+
+    MIN_PREFIX_LENGTH = 3
+
+    def __init__(self, maxsize: int, ttl: float, pool: AutocompleteSearchPool):
+        super().__init__(maxsize, ttl, kind="search")
+        self.pool = pool
+        self.user_flights = {}
+        self.waiters = {}
+        self.sorted_keys = []  # Präfix-Index über die Schlüssel, veraltete werden beim Lesen entfernt
+        self.prefix_hits = 0
+        self.superseded = 0
+
+    def should_cache(self, value) -> bool:
+        return bool(value)
+
+    def remember(self, key, value):
+        if key not in self.cache:
+            bisect.insort(self.sorted_keys, key)
+        super().remember(key, value)
+        if len(self.sorted_keys) > 2 * self.cache.maxsize:
+            self.sorted_keys = sorted(self.cache.keys())  # vom TTLCache verdrängte Schlüssel loswerden
+
+    def nearest(self, kind: str, normalized: str):
+        """Sucht ein gecachtes Ergebnis für einen kürzeren oder längeren Präfix der Anfrage."""
+        for length in range(len(normalized) - 1, self.MIN_PREFIX_LENGTH - 1, -1):
+            result = self.cache.get((kind, normalized[:length]))
+            if result:
+                return result
+        # Längere Anfragen mit diesem Präfix stehen im sortierten Index direkt dahinter
+        index = bisect.bisect_left(self.sorted_keys, (kind, normalized))
+        while index < len(self.sorted_keys):
+            key = self.sorted_keys[index]
+            if key[0] != kind or not key[1].startswith(normalized):
+                break
+            result = self.cache.get(key)
+            if result:
+                return result
+            del self.sorted_keys[index]  # abgelaufen oder verdrängt
+        return None
 
-    return message
+    @staticmethod
+    def rank(results: list[tuple[str, str]], normalized: str) -> list[tuple[str, str]]:
+        """Sortiert Ergebnisse nach oben, deren Titel alle bisher getippten Wörter enthält."""
+        words = normalized.split()
+        return sorted(results, key=lambda r: not all(w in normalize_query(r[0]) for w in words))
+
+    def track_user(self, user, key):
+        """Merkt sich die aktuelle Suche eines Nutzers und gibt seine vorherige frei."""
+        previous = self.user_flights.get(user)
+        if previous == key:
+            return
+        if previous is not None:
+            self.release(previous)
+        self.user_flights[user] = key
+        self.waiters[key] = self.waiters.get(key, 0) + 1
+
+    def release(self, key):
+        self.waiters[key] -= 1
+        if self.waiters[key] > 0:
+            return
+        del self.waiters[key]
+        task = self.in_flight.get(key)
+        if task is not None and task.cancel():
+            self.superseded += 1
+
+    def forget_user(self, user, key):
+        if self.user_flights.get(user) == key:
+            del self.user_flights[user]
+            self.waiters[key] -= 1
+            if self.waiters[key] <= 0:
+                del self.waiters[key]
+
+    async def search(self, interaction: discord.Interaction, kind: str, query: str, to_search_query) -> list[tuple[str, str]]:
+        normalized = normalize_query(query)
+        if not normalized:
+            return []
+
+        key = (kind, normalized)
+        user = (interaction.guild_id, interaction.user.id)
+        if key in self.cache:
+            self.hits += 1
+            if user in self.user_flights:
+                self.release(self.user_flights.pop(user))
+            return self.cache[key]
+
+        fetch = lambda: self.pool.search(to_search_query(normalized))
+        self.track_user(user, key)
+
+        nearby = self.nearest(kind, normalized)
+        if nearby is not None:
+            self.prefix_hits += 1
+            task = self.start_fetch(key, fetch)
+            # Die Suche läuft im Hintergrund weiter, danach den Nutzer wie im finally unten vergessen
+            task.add_done_callback(lambda t: self.forget_user(user, key))
+            return self.rank(nearby, normalized)
 
+        try:
+            return await self.get_or_fetch(key, fetch)
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            return []
+        finally:
+            self.forget_user(user, key)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["prefix_hits"] = self.prefix_hits
+        stats["superseded"] = self.superseded
+        return stats
+
+
+search_cache = SearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, autocomplete_pool)
+
+
+# --- Auflösung mit Single-Flight und Negativ-Cache ---
+PERMANENT_ERROR_MARKERS = (
+    "video unavailable", "private video", "has been removed", "account associated with this video has been terminated",
+    "confirm your age", "age-restricted", "inappropriate for some users", "copyright", "members-only",
+    "not available in your country", "unsupported url", "does not exist", "keine suchergebnisse",
+)
+
+
+def classify_error(error: Exception) -> str:
+    """Ordnet einen yt-dlp-Fehler ein: "throttled", "permanent" oder "transient"."""
+    if is_throttle_error(error):
+        return "throttled"
+    message = str(error).lower()
+    if any(marker in message for marker in PERMANENT_ERROR_MARKERS):
+        return "permanent"
+    return "transient"
+
+
+class ResolveCache(AsyncTTLCache):
+    """Cache für Auflösungen mit Single-Flight und getrenntem Negativ-Cache.
+
+    Fehlschläge werden nicht mehr wie zuvor 24h lang als None gecacht: Dauerhafte Fehler
+    (gelöscht, altersbeschränkt, ...) werden PERMANENT_ERROR_TTL lang gemerkt, vorübergehende
+    Fehler (Netzwerk, Drosselung) nur TRANSIENT_ERROR_TTL lang.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, kind: str = None):
+        super().__init__(maxsize, ttl, kind)
+        self.name = name
+        self.negative = TLRUCache(maxsize=maxsize, ttu=self.negative_ttu)
+        self.negative_hits = 0
+        self.errors = {"permanent": 0, "transient": 0, "throttled": 0}
+
+    @staticmethod
+    def negative_ttu(key, error_class: str, now: float) -> float:
+        return now + (PERMANENT_ERROR_TTL if error_class == "permanent" else TRANSIENT_ERROR_TTL)
+
+    def on_error(self, key, error: Exception):
+        error_class = classify_error(error)
+        self.errors[error_class] += 1
+        self.negative[key] = error_class
+        print(f"Fehler bei yt-dlp ({self.name}, {error_class}): {error}")
+
+    async def resolve(self, key, fetch):
+        """Gibt das (gecachte) Ergebnis von fetch() zurück oder None, falls die Auflösung fehlschlägt."""
+        if key in self.negative:
+            self.negative_hits += 1
+            return None
+        try:
+            return await self.get_or_fetch(key, fetch)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return None
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["negative"] = len(self.negative)
+        stats["negative_hits"] = self.negative_hits
+        stats["errors"] = dict(self.errors)
+        return stats
+
+
+info_cache = ResolveCache("Songs", INFO_CACHE_SIZE, INFO_CACHE_TTL, kind="info")
+playlist_cache = ResolveCache("Playlists", 256, INFO_CACHE_TTL, kind="playlist")
+# Die Stream-URLs selbst liegen in stream_urls, hier werden nur gleichzeitige Erneuerungen zusammengelegt
+stream_cache = ResolveCache("Stream-URLs", 1000, 60)
+
+
+# --- Vorausladen der Stream-URLs ---
+pending_resolutions = {}
+prefetch_semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+
+
+def has_valid_stream_url(track: Track) -> bool:
+    if not track.url:
+        return False
+    return track.expires is None or track.expires - STREAM_URL_MARGIN > time.time()
+
+
+async def _resolve_stream_url(track: Track, priority: int) -> bool:
+    result = await extraction_engine.get_stream_url(track.webpage_url, priority=priority)
+    if not result or not result[0]:
+        return False
+    track.url, track.expires, track.acodec = result
+    return True
+
+
+async def ensure_stream_url(track: Track, priority: int = PRIORITY_INTERACTIVE) -> bool:
+    """Löst die Stream-URL eines Songs auf, falls sie fehlt oder bald abläuft. Läuft bereits
+    eine Auflösung (z.B. durch das Vorausladen), wird auf diese gewartet."""
+    if has_valid_stream_url(track):
+        return True
+    task = pending_resolutions.get(id(track))
+    if task is None:
+        task = asyncio.create_task(_resolve_stream_url(track, priority))
+        pending_resolutions[id(track)] = task
+        task.add_done_callback(lambda t: pending_resolutions.pop(id(track), None))
+    return await asyncio.shield(task)
+
+
+async def _prefetch(track: Track) -> bool:
+    async with prefetch_semaphore:
+        return await ensure_stream_url(track, PRIORITY_BACKGROUND)
+
+
+def prefetch_upcoming(guild_id: int):
+    """Löst die nächsten PREFETCH_AHEAD Songs der Warteschlange mit begrenzter Parallelität auf
+    bzw. erneuert ihre Stream-URLs, damit beim Songwechsel nicht mehr auf yt-dlp gewartet wird.
+    Nebenbei wird ihre Lautheit vermessen."""
+    upcoming = get_player(guild_id).upcoming(PREFETCH_AHEAD)
+    for track in upcoming:
+        if not has_valid_stream_url(track) and id(track) not in pending_resolutions:
+            asyncio.create_task(_prefetch(track))
+    for track in upcoming[:AUDIO_CACHE_AHEAD]:
+        audio_cache.prefetch(track)
+    for track in upcoming:
+        loudness_analyzer.schedule(track)
+
+
+# --- Audio-Cache auf der Festplatte ---
+def download_audio(webpage_url: str, key: str, max_filesize: int):
+    """Lädt die Audiospur eines Songs nach AUDIO_CACHE_DIR/<key>.<ext> herunter."""
+    youtube_dl = load_yt_dlp().YoutubeDL
+    options = {
+        'format': 'bestaudio',
+        'noplaylist': True,
+        'quiet': True,
+        'outtmpl': f"{AUDIO_CACHE_DIR}/{key}.%(ext)s",
+        'max_filesize': max_filesize,
+        'plugin_dirs': YDL_OPTIONS["plugin_dirs"],
+    }
+    with youtube_dl(options) as ydl:
+        info = ydl.extract_info(webpage_url, download=True)
+        rate_limiter.report_success()
+        path = ydl.prepare_filename(info)
+    if not os.path.isfile(path):
+        return None
+    return path, info.get("acodec")
+
+
+class AudioCache:
+    """Inhaltsadressierter Cache für heruntergeladene Songs unter temp_audio/cache.
+
+    Die nächsten AUDIO_CACHE_AHEAD Songs der Warteschlange werden im Hintergrund
+    heruntergeladen. Wiederholungen, Loop und Songs, die auf mehreren Servern laufen,
+    werden dann von der Festplatte abgespielt. Ist der Cache größer als max_bytes,
+    werden die am längsten nicht gespielten Dateien gelöscht.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (Pfad, Größe, Codec), älteste zuerst
+        self.total_bytes = 0
+        self.in_use = {}
+        self.downloading = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.downloads = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(track: Track) -> str:
+        return hashlib.sha256(track.webpage_url.encode()).hexdigest()[:32]
+
+    @staticmethod
+    def is_cacheable(track: Track) -> bool:
+        return bool(track.webpage_url) and track.webpage_url.startswith("http") and not is_discord_attachment(track.webpage_url)
+
+    def load(self):
+        """Liest den bestehenden Cache beim Start ein und räumt halbe Downloads weg."""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith((".part", ".ytdl")):
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name.split(".")[0], entry.path, stat.st_size))
+        for _, key, path, size in sorted(files):
+            self.entries[key] = (path, size, None)
+            self.total_bytes += size
+        self.evict()
+        print(f"Audio-Cache: {len(self.entries)} Dateien, {self.total_bytes / 1024 ** 2:.0f} MiB")
+
+    def has(self, track: Track) -> bool:
+        return self.is_cacheable(track) and self.key_for(track) in self.entries
+
+    def lookup(self, track: Track):
+        """Gibt (Pfad, Codec) zurück, falls der Song im Cache liegt, und zählt Treffer/Fehltreffer."""
+        if not self.is_cacheable(track):
+            return None
+        key = self.key_for(track)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        path, size, acodec = entry
+        self.hits += 1
+        self.bytes_saved += size
+        self.entries.move_to_end(key)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path, acodec
+
+    def acquire(self, path: str):
+        self.in_use[path] = self.in_use.get(path, 0) + 1
+
+    def set_codec(self, path: str, acodec: str):
+        """Merkt sich den per ffprobe bestimmten Codec einer beim Start eingelesenen Datei."""
+        key = os.path.basename(path).split(".")[0]
+        entry = self.entries.get(key)
+        if entry and entry[0] == path:
+            self.entries[key] = (path, entry[1], acodec)
+
+    def release(self, path: str):
+        self.in_use[path] -= 1
+        if self.in_use[path] <= 0:
+            del self.in_use[path]
+        self.evict()
+
+    def prefetch(self, track: Track):
+        if AUDIO_CACHE_AHEAD <= 0 or not self.is_cacheable(track):
+            return
+        key = self.key_for(track)
+        if key in self.entries or key in self.downloading:
+            return
+        task = asyncio.create_task(self._download(track.webpage_url, key))
+        self.downloading[key] = task
+        task.add_done_callback(lambda t: self.downloading.pop(key, None))
 
-async def remove_old_pins(interaction: discord.Interaction):
-    pins = await interaction.channel.pins()
+    async def _download(self, webpage_url: str, key: str):
+        try:
+            result = await download_engine.run(download_audio, webpage_url, key, self.max_bytes // 4, priority=PRIORITY_BACKGROUND)
+        except Exception as e:
+            print(f"Fehler beim Herunterladen in den Audio-Cache: {e}")
+            rate_limiter.report_error(e)
+            return
+        if not result:
+            return
+        path, acodec = result
+        size = os.path.getsize(path)
+        self.entries[key] = (path, size, acodec)
+        self.total_bytes += size
+        self.downloads += 1
+        self.evict()
+
+    def evict(self):
+        for key in list(self.entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            path, size, _ = self.entries[key]
+            if path in self.in_use:
+                continue
+            del self.entries[key]
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "files": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "hits": self.hits,
+            "bytes_saved": self.bytes_saved,
+            "downloads": self.downloads,
+            "downloading": len(self.downloading),
+            "evictions": self.evictions,
+        }
+
+
+download_engine = ExtractionEngine("download", AUDIO_CACHE_WORKERS)
+audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES)
+
+
+# --- Hochgeladene Dateien ---
+DISCORD_CDN_HOSTS = ("cdn.discordapp.com", "media.discordapp.net")
+
+
+def is_discord_attachment(url: str) -> bool:
+    return urllib.parse.urlparse(url).hostname in DISCORD_CDN_HOSTS
+
+
+class UploadStore:
+    """Inhaltsadressierte Ablage für /play-file unter temp_audio/uploads.
+
+    Ein Upload wird sofort direkt vom Discord-CDN gestreamt und parallel dazu
+    heruntergeladen. Die Datei heißt nach dem SHA-256 ihres Inhalts, gleiche Uploads
+    liegen also nur einmal auf der Festplatte. Jeder Track, der auf eine Datei zeigt, hält
+    eine Referenz, bis er aus Warteschlange und Verlauf verschwunden ist
+    (weakref.finalize, die Freigabe läuft dann auf der Event-Loop). Dateien ohne Referenz bleiben liegen und werden erst verdrängt
+    (zuletzt benutzt zuletzt), wenn max_bytes überschritten ist.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, int] = OrderedDict()  # Pfad -> Größe, zuletzt benutzt am Ende
+        self.total_bytes = 0
+        self.refs = {}
+        self.session = None
+        self.uploads = 0
+        self.deduplicated = 0
+        self.bytes_deduplicated = 0
+        self.evictions = 0
+
+    def load(self):
+        """Liest die Ablage beim Start ein und räumt abgebrochene Downloads weg."""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".part"):
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(files):
+            self.entries[path] = size
+            self.total_bytes += size
+        print(f"Uploads: {len(self.entries)} Dateien, {self.total_bytes / 1024 ** 2:.0f} MiB")
+
+    def attach(self, track: Track):
+        """Zählt track als Referenz auf seine Datei, bis das Track-Objekt freigegeben wird."""
+        path = track.url
+        if path not in self.entries:
+            return
+        self.refs[path] = self.refs.get(path, 0) + 1
+        self.entries.move_to_end(path)
+        weakref.finalize(track, self.release_soon, path)
 
-    for pin in pins:
-        if pin.author.id == client.application_id:
-            if pin != music_queues.get(interaction.guild.id).get("now_playing_message"):
-                await pin.delete()
+    def release_soon(self, path: str):
+        # finalize() kann in jedem Thread laufen, auch mitten in einer anderen Methode dieser Klasse
+        try:
+            client.loop.call_soon_threadsafe(self.release, path)
+        except RuntimeError:
+            pass  # Event-Loop bereits geschlossen
+
+    def release(self, path: str):
+        self.refs[path] -= 1
+        if self.refs[path] <= 0:
+            del self.refs[path]
+        if path in self.entries:
+            self.entries.move_to_end(path)
+        self.evict()
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    async def ingest(self, attachment: discord.Attachment, track: Track):
+        """Speichert den Anhang und stellt track danach auf die lokale Datei um."""
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_read=60))
+        part_path = os.path.join(self.directory, f"{attachment.id}.part")
+        digest = hashlib.sha256()
+        loop = asyncio.get_running_loop()
+        try:
+            async with self.session.get(attachment.url) as response:
+                response.raise_for_status()
+                with open(part_path, "wb") as f:
+                    async for chunk in response.content.iter_chunked(UPLOAD_CHUNK_SIZE):
+                        digest.update(chunk)
+                        await loop.run_in_executor(None, f.write, chunk)
+            size = os.path.getsize(part_path)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            print(f"Fehler beim Speichern von {attachment.filename}: {e}")
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            return
+
+        extension = os.path.splitext(attachment.filename)[1].lower()
+        path = os.path.join(self.directory, digest.hexdigest()[:32] + extension)
+        if path in self.entries:
+            self.deduplicated += 1
+            self.bytes_deduplicated += size
+            os.remove(part_path)
+        else:
+            os.replace(part_path, path)
+            self.entries[path] = size
+            self.total_bytes += size
+            self.uploads += 1
+        track.url = track.webpage_url = path
+        track.expires = None
+        self.attach(track)
+        self.evict()
+
+    def evict(self):
+        for path in list(self.entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if path in self.refs:
+                continue
+            self.total_bytes -= self.entries.pop(path)
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "referenced": len(self.refs),
+            "uploads": self.uploads,
+            "deduplicated": self.deduplicated,
+            "bytes_deduplicated": self.bytes_deduplicated,
+            "evictions": self.evictions,
+        }
+
+
+upload_store = UploadStore(UPLOAD_DIR, UPLOAD_MAX_BYTES)
+
+
+# --- Lautheitsanalyse ---
+loudness_analysis_duration = metrics.histogram(
+    "musicbot_loudness_analysis_seconds", "Dauer einer Lautheitsmessung mit ffmpeg (ebur128)", LATENCY_BUCKETS)
+
+
+def parse_ebur128(output: str):
+    """Liest [integrierte Lautheit in LUFS, True Peak in dBFS] aus der Zusammenfassung von ebur128.
+    Der Peak ist None bei völliger Stille."""
+    summary = output.rsplit("Summary:", 1)[-1]
+    integrated = re.search(r"I:\s+(-?[\d.]+) LUFS", summary)
+    peak = re.search(r"Peak:\s+(-?[\d.]+) dBFS", summary)
+    if not integrated:
+        return None
+    return [float(integrated.group(1)), float(peak.group(1)) if peak else None]
+
+
+def loudness_gain(loudness: list) -> float:
+    """Verstärkung in dB auf LOUDNESS_TARGET, ohne dass der True Peak über LOUDNESS_TRUE_PEAK steigt."""
+    integrated, peak = loudness
+    gain = LOUDNESS_TARGET - integrated
+    if peak is not None:
+        gain = min(gain, LOUDNESS_TRUE_PEAK - peak)
+    return max(-LOUDNESS_MAX_GAIN, min(LOUDNESS_MAX_GAIN, gain))
+
+
+class LoudnessAnalyzer:
+    """Misst die Lautheit jedes Songs einmal im Hintergrund und speichert sie in der Metadaten-Datenbank.
+
+    Gemessen wird nur beim Vorausladen (prefetch_upcoming), bevorzugt die Datei im Audio-Cache,
+    sonst die Stream-URL. Wie das Auflösen der URLs begrenzt prefetch_semaphore die Messungen.
+    Beim Abspielen kostet der Ausgleich dann nur noch einen volume-Filter, noch nicht vermessene
+    Songs schätzt loudnorm in einem Durchgang, sofern sie ohnehin kodiert werden. Die PIDs der
+    Mess-Prozesse stehen in pids, damit kill_orphaned_ffmpeg sie nicht für verwaist hält.
+    """
+
+    def __init__(self, workers: int):
+        self.semaphore = asyncio.Semaphore(workers)
+        self.pending = {}
+        self.failures = TTLCache(maxsize=1000, ttl=60 * 60)  # nicht ständig erneut versuchen
+        self.pids = set()
+        self.analyzed = 0
+        self.failed = 0
+        self.plays = {"precomputed": 0, "fallback": 0, "unmeasured": 0}
+
+    async def lookup(self, track: Track):
+        if track.loudness is None and track.webpage_url:
+            track.loudness = await metadata_store.get("loudness", track.webpage_url)
+        return track.loudness
+
+    def schedule(self, track: Track):
+        key = track.webpage_url
+        if not LOUDNESS_NORMALIZATION or track.loudness is not None or not key or key in self.pending or key in self.failures:
+            return
+        task = self.pending[key] = asyncio.create_task(self.analyze(track))
+        task.add_done_callback(lambda t: self.pending.pop(key, None))
+
+    async def analyze(self, track: Track):
+        if await self.lookup(track) is not None:
+            return
+        download = audio_cache.downloading.get(audio_cache.key_for(track)) if audio_cache.is_cacheable(track) else None
+        if download:
+            await asyncio.shield(download)  # lieber die fertige Datei messen als den Stream ein zweites Mal laden
+        async with self.semaphore:
+            cached_path = None
+            if audio_cache.has(track):
+                cached_path = audio_cache.entries[audio_cache.key_for(track)][0]
+                audio_cache.acquire(cached_path)
+            elif not await _prefetch(track):
+                self.failures[track.webpage_url] = True
+                return
+            try:
+                async with prefetch_semaphore:
+                    loudness = await self.measure(cached_path or track.url)
+            finally:
+                if cached_path:
+                    audio_cache.release(cached_path)
+        if loudness is None:
+            self.failed += 1
+            self.failures[track.webpage_url] = True
+            return
+        self.analyzed += 1
+        track.loudness = loudness
+        metadata_store.put("loudness", track.webpage_url, loudness, LOUDNESS_TTL)
+
+    async def measure(self, url: str):
+        args = ["ffmpeg", "-hide_banner", "-nostats"]
+        if url.startswith("http"):
+            args += FFMPEG_OPTIONS["before_options"].split()
+        args += ["-i", url, "-vn", "-af", "ebur128=peak=true:framelog=quiet", "-f", "null", "-"]
+        start = time.perf_counter()
+        try:
+            process = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            print(f"Konnte ffmpeg für die Lautheitsmessung nicht starten: {e}")
+            return None
+        self.pids.add(process.pid)
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), LOUDNESS_TIMEOUT)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return None
+        finally:
+            self.pids.discard(process.pid)
+        if process.returncode != 0:
+            return None
+        loudness_analysis_duration.observe(time.perf_counter() - start)
+        return parse_ebur128(stderr.decode(errors="replace"))
+
+    def playback_filter(self, track: Track, transcoding: bool):
+        """ffmpeg-Audiofilter für den Lautheitsausgleich oder None. Ohne gespeicherte Messung
+        wird eine Opus-Quelle, die sonst nur umverpackt würde (transcoding=False), nicht angefasst."""
+        if not LOUDNESS_NORMALIZATION:
+            return None
+        if track.loudness is None:
+            if not transcoding:
+                self.plays["unmeasured"] += 1
+                return None
+            self.plays["fallback"] += 1
+            return f"loudnorm=I={LOUDNESS_TARGET}:TP={LOUDNESS_TRUE_PEAK}:LRA=11,aresample=48000"
+        self.plays["precomputed"] += 1
+        gain = loudness_gain(track.loudness)
+        return f"volume={gain:.1f}dB" if abs(gain) >= LOUDNESS_TOLERANCE else None
+
+    def stats(self) -> dict:
+        plays = sum(self.plays.values())
+        return {
+            "analyzed": self.analyzed,
+            "failed": self.failed,
+            "running": len(self.pids),
+            "pending": max(0, len(self.pending) - len(self.pids)),
+            "precomputed": self.plays["precomputed"],
+            "fallback": self.plays["fallback"],
+            "unmeasured": self.plays["unmeasured"],
+            "coverage": self.plays["precomputed"] / plays if plays else 0.0,
+        }
+
+
+loudness_analyzer = LoudnessAnalyzer(LOUDNESS_WORKERS)
+
+
+# --- Audioquellen ---
+playback_cpu_stats = {}
+# PIDs der ffmpeg-Prozesse von FFmpegOpusAudio/FFmpegPCMAudio. Nur diese darf kill_orphaned_ffmpeg
+# beenden, ffmpeg-Prozesse von yt-dlp (z.B. beim Herunterladen in den Audio-Cache) bleiben unberührt.
+spawned_ffmpeg = set()
+
+
+def process_cpu_seconds(pid: int) -> float:
+    """Liest die bisher verbrauchte CPU-Zeit (user + system) eines Prozesses aus /proc."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+def playback_cpu(mode: str) -> dict:
+    return playback_cpu_stats.setdefault(mode, {"streams": 0, "ffmpeg_cpu": 0.0, "player_cpu": 0.0, "audio_seconds": 0.0})
+
+
+class MeasuredSource(discord.AudioSource):
+    """Reicht eine ffmpeg-Quelle durch und misst die CPU-Zeit von ffmpeg und vom
+    Player-Thread (Lesen, Opus-Kodierung, Senden) für den jeweiligen Wiedergabemodus."""
+
+    def __init__(self, source: discord.FFmpegAudio, mode: str, cached_path: str = None):
+        self.source = source
+        self.mode = mode
+        self.cached_path = cached_path
+        self.frames = 0
+        self.thread_cpu_start = None
+        self.thread_cpu = 0.0
+        self.prewarmed = False
+        self.started_after = None  # Ende des vorherigen Songs (perf_counter) zur Messung der Lücke
+        self.cleaned_up = False
+
+    @property
+    def position(self) -> float:
+        """Bisher abgespielte Sekunden."""
+        return self.frames * 0.02
+
+    def read(self) -> bytes:
+        now = time.thread_time()
+        if self.thread_cpu_start is None:
+            self.thread_cpu_start = now
+            if self.started_after is not None:
+                label = "vorgewärmt" if self.prewarmed else "kalt"
+                track_gap.observe(time.perf_counter() - self.started_after, label)
+        self.thread_cpu = now - self.thread_cpu_start
+        self.frames += 1
+        return self.source.read()
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        # Wird vom Player-Thread und später noch einmal von AudioSource.__del__ aufgerufen
+        if self.cleaned_up:
+            return
+        self.cleaned_up = True
+        process = getattr(self.source, "_process", None)
+        ffmpeg_cpu = process_cpu_seconds(process.pid) if process else 0.0
+        self.source.cleanup()
+        if process:
+            spawned_ffmpeg.discard(process.pid)
+        if self.cached_path:
+            # cleanup() läuft im Player-Thread, der Cache gehört dem Event-Loop
+            client.loop.call_soon_threadsafe(audio_cache.release, self.cached_path)
+
+        if not self.frames:
+            return  # z.B. verworfene vorgewärmte Quelle
+        stats = playback_cpu(self.mode)
+        stats["streams"] += 1
+        stats["ffmpeg_cpu"] += ffmpeg_cpu
+        stats["player_cpu"] += self.thread_cpu
+        stats["audio_seconds"] += self.frames * 0.02
+
+
+async def create_audio_source(track: Track) -> MeasuredSource:
+    """Erstellt die ffmpeg-Quelle passend zu PLAYBACK_MODE.
+
+    Ist die Quelle bereits Opus (bei YouTube meistens WebM/Opus), wird sie nur umverpackt
+    (-c:a copy) und discord.py muss nicht mehr jeden 20ms-Frame selbst kodieren.
+    Mit SHARED_SOURCES teilen sich Server, die denselben Song kurz nacheinander starten,
+    eine ffmpeg-Pipeline (siehe SharedStream).
+    """
+    key = (track.webpage_url or track.url, PLAYBACK_MODE)
+    if SHARED_SOURCES:
+        reader = shared_sources.join(key)
+        if reader:
+            return MeasuredSource(reader, reader.stream.mode)
+
+    url, codec = track.url, track.acodec
+    cached = audio_cache.lookup(track)
+    if cached:
+        url, codec = cached
+        audio_cache.acquire(url)
+    options = {} if url.startswith("temp_audio/") else FFMPEG_OPTIONS
+    cached_path = url if cached else None
+    if PLAYBACK_MODE != "pcm" and (not codec or codec == "none"):
+        # z.B. hochgeladene Dateien: Codec einmalig mit ffprobe bestimmen
+        codec, _ = await discord.FFmpegOpusAudio.probe(url)
+        if cached:
+            audio_cache.set_codec(url, codec)  # nach einem Neustart kennt der Cache den Codec nicht
+        else:
+            track.acodec = codec
+    audio_filter = None
+    if LOUDNESS_NORMALIZATION:
+        await loudness_analyzer.lookup(track)
+        audio_filter = loudness_analyzer.playback_filter(track, transcoding=PLAYBACK_MODE == "pcm" or codec != "opus")
+    if audio_filter:
+        options = {**options, "options": f"{options.get('options', '')} -af {audio_filter}".strip()}
+
+    if PLAYBACK_MODE == "pcm":
+        source, mode = discord.FFmpegPCMAudio(url, **options), "pcm"
+    else:
+        # Ein Filter lässt sich nicht mit -c:a copy kombinieren
+        mode = "copy" if codec == "opus" and not audio_filter else "ffmpeg-opus"
+        source = discord.FFmpegOpusAudio(url, bitrate=PLAYBACK_BITRATE, codec=codec if mode == "copy" else None, **options)
+    spawned_ffmpeg.add(source._process.pid)
+    if SHARED_SOURCES:
+        return MeasuredSource(shared_sources.start(key, source, mode, cached_path), mode)
+    return MeasuredSource(source, mode, cached_path)
+
+
+# --- Geteilte Quellen ---
+class SharedStream:
+    """Eine ffmpeg-Pipeline, deren kodierte Frames sich mehrere Server teilen.
+
+    Die Frames landen in einem Puffer, jeder Zuhörer liest mit seinem eigenen Index daraus.
+    Nur wer am Ende des Puffers angekommen ist, liest aus ffmpeg nach, ein eigener Thread ist
+    dafür nicht nötig. Solange die ersten SHARED_SOURCE_WINDOW Sekunden gepuffert sind, können
+    weitere Server von vorne einsteigen, danach wird verworfen, was kein Zuhörer mehr braucht.
+    Wer mehr als SHARED_SOURCE_MAX_LAG zurückliegt (z.B. lange pausiert), springt zum ältesten
+    noch gepufferten Frame.
+    """
+
+    def __init__(self, key, source: discord.FFmpegAudio, mode: str, cached_path: str = None):
+        self.key = key
+        self.source = source
+        self.mode = mode
+        self.cached_path = cached_path
+        # Bei PCM wird einmal für alle kodiert, die Zuhörer bekommen immer Opus
+        self.encoder = None if source.is_opus() else discord.opus.Encoder(bitrate=PLAYBACK_BITRATE, signal_type="music")
+        self.frames = []
+        self.base = 0  # Index des ersten gepufferten Frames
+        self.eof = False
+        self.closed = False
+        self.readers = set()
+        self.lock = threading.Lock()
+        self.read_lock = threading.Lock()  # nur ein Zuhörer liest gleichzeitig aus ffmpeg
+
+    @property
+    def end(self) -> int:
+        return self.base + len(self.frames)
+
+    def buffered(self, index: int):
+        """Frame index aus dem Puffer, b"" am Ende, None falls noch nicht gelesen. Muss unter self.lock laufen."""
+        if index < self.end:
+            return self.frames[index - self.base]
+        return b"" if self.eof else None
+
+    def frame(self, index: int) -> tuple[bytes, int, bool]:
+        """Gibt (Frame, tatsächlicher Index, aus dem Puffer geteilt) zurück."""
+        with self.lock:
+            if index < self.base:
+                shared_source_stats["skipped_frames"] += self.base - index
+                index = self.base
+            data = self.buffered(index)
+        if data is not None:
+            return data, index, True
+        with self.read_lock:
+            with self.lock:
+                data = self.buffered(index)  # inzwischen von einem anderen Zuhörer gelesen
+            if data is not None:
+                return data, index, True
+            try:
+                data = self.source.read()
+                if data and self.encoder:
+                    data = self.encoder.encode(data, discord.opus.Encoder.SAMPLES_PER_FRAME)
+            except Exception as e:
+                print(f"Fehler beim Lesen der geteilten Quelle: {e}")
+                data = b""
+            with self.lock:
+                if not data:
+                    self.eof = True
+                    return b"", index, False
+                self.frames.append(data)
+                if self.end % 250 == 0:
+                    self.trim()
+            return data, index, False
+
+    def trim(self):
+        """Verwirft Frames, die niemand mehr braucht. Muss unter self.lock laufen."""
+        if self.end <= SHARED_SOURCE_WINDOW / 0.02:
+            keep_from = 0  # Anfang für weitere Zuhörer aufheben
+        else:
+            keep_from = min((reader.offset for reader in self.readers), default=self.end)
+        keep_from = max(keep_from, self.end - int(SHARED_SOURCE_MAX_LAG / 0.02), self.base)
+        del self.frames[:keep_from - self.base]
+        self.base = keep_from
+
+    def close(self):
+        process = getattr(self.source, "_process", None)
+        playback_cpu(self.mode)["ffmpeg_cpu"] += process_cpu_seconds(process.pid) if process else 0.0
+        self.source.cleanup()
+        if process:
+            spawned_ffmpeg.discard(process.pid)
+        self.frames = []
+        if self.cached_path:
+            client.loop.call_soon_threadsafe(audio_cache.release, self.cached_path)
+
+
+class SharedReader(discord.AudioSource):
+    """Ein Zuhörer einer SharedStream, liest ab Frame 0 mit eigenem Index."""
+
+    def __init__(self, stream: SharedStream):
+        self.stream = stream
+        self.offset = 0
+        self.released = False
+
+    def read(self) -> bytes:
+        data, index, shared = self.stream.frame(self.offset)
+        self.offset = index + 1
+        if shared and data:
+            shared_source_stats["shared_frames"] += 1
+            shared_source_stats["shared_bytes"] += len(data)
+        return data
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self):
+        if not self.released:
+            self.released = True
+            shared_sources.release(self)
+
+
+class SharedSources:
+    """Hält die laufenden SharedStreams, Schlüssel ist der Song und der Wiedergabemodus."""
+
+    def __init__(self):
+        self.streams = {}
+        self.lock = threading.Lock()
+
+    def join(self, key):
+        """Hängt sich an eine laufende Pipeline, solange deren Anfang noch gepuffert ist."""
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is None or stream.closed or stream.base > 0:
+                return None
+            with stream.lock:
+                reader = SharedReader(stream)
+                stream.readers.add(reader)
+        shared_source_stats["joined"] += 1
+        return reader
+
+    def start(self, key, source: discord.FFmpegAudio, mode: str, cached_path: str = None) -> SharedReader:
+        stream = SharedStream(key, source, mode, cached_path)
+        reader = SharedReader(stream)
+        stream.readers.add(reader)
+        with self.lock:
+            self.streams[key] = stream  # eine gleichzeitig gestartete Pipeline läuft ungeteilt weiter
+        shared_source_stats["started"] += 1
+        return reader
+
+    def release(self, reader: SharedReader):
+        stream = reader.stream
+        with self.lock, stream.lock:
+            stream.readers.discard(reader)
+            if stream.readers or stream.closed:
+                return
+            stream.closed = True
+            if self.streams.get(stream.key) is stream:
+                del self.streams[stream.key]
+        stream.close()
+
+    def pids(self) -> set[int]:
+        with self.lock:
+            processes = [getattr(stream.source, "_process", None) for stream in self.streams.values()]
+        return {process.pid for process in processes if process}
+
+    def stats(self) -> dict:
+        with self.lock:
+            streams = list(self.streams.values())
+        return {
+            **shared_source_stats,
+            "streams": len(streams),
+            "listeners": sum(len(stream.readers) for stream in streams),
+            "buffered_bytes": sum(sum(map(len, stream.frames)) for stream in streams),
+        }
+
+
+shared_source_stats = {"started": 0, "joined": 0, "shared_frames": 0, "shared_bytes": 0, "skipped_frames": 0}
+shared_sources = SharedSources()
+
+
+# --- Gemeinsamer Audio-Takt ---
+audio_tick_duration = metrics.histogram(
+    "musicbot_audio_tick_seconds", "Rechenzeit eines 20ms-Takts des gemeinsamen Audio-Takts", LAG_BUCKETS)
+
+
+def pipe_ready(pipe, min_bytes: int = 1) -> bool:
+    """Ob aus der ffmpeg-Pipe gelesen werden kann, ohne auf ffmpeg zu warten (Linux, FIONREAD)."""
+    if not select.select([pipe], [], [], 0)[0]:
+        return False
+    available = struct.unpack("i", fcntl.ioctl(pipe, termios.FIONREAD, b"\0" * 4))[0]
+    return available >= min_bytes or available == 0  # lesbar, aber leer: ffmpeg ist fertig
+
+
+class ScheduledPlayback:
+    """Ersetzt den AudioPlayer-Thread von discord.py für eine Sprachverbindung, wenn AUDIO_SCHEDULER="shared".
+
+    VoiceClient (discord.py 2.6.4) greift an genau diesen Stellen auf seinen privaten _player zu:
+    is_playing() -> is_playing(), is_paused() -> is_paused(), stop() -> stop() und setzt _player
+    auf None (auch beim disconnect), pause() -> pause(), resume() -> resume(), die Eigenschaft
+    source -> source und ihr Setter -> set_source(). Voice-State und Gateway fassen _player nicht
+    an. Diese Klasse bietet genau diese Attribute (dazu after wie AudioPlayer); bei einer anderen
+    discord.py-Version fällt der Bot auf "threads" zurück (AUDIO_SCHEDULER_DISCORD_VERSION). Die Frames lesen (und bei PCM kodieren) die Reader-Threads
+    des AudioScheduler im Voraus, gesendet werden sie vom gemeinsamen Takt-Thread.
+    """
+
+    def __init__(self, scheduler: "AudioScheduler", voice_client: discord.VoiceClient, source: discord.AudioSource, after):
+        self.scheduler = scheduler
+        self.client = voice_client
+        self.source = source
+        self.after = after
+        self.stats = scheduler.guild_stats(voice_client.guild.id)
+        self.frames = deque()
+        self.encode = not source.is_opus()
+        self.eof = False
+        self.ended = False
+        self.paused = False
+        self.refilling = False
+        self.started = False  # erster Frame gelesen
+        inner = getattr(source, "source", source)
+        self.pipe = getattr(inner, "_stdout", None)  # stdout von ffmpeg, falls vorhanden
+        self.silence = 0  # noch zu sendende Stille-Frames nach einer Pause
+        self.error = None
+        self.cpu = 0.0
+
+    # Schnittstelle von discord.player.AudioPlayer
+    def is_playing(self) -> bool:
+        return not self.ended and not self.paused
+
+    def is_paused(self) -> bool:
+        return not self.ended and self.paused
+
+    def stop(self):
+        self.ended = True
+        self.paused = False
+
+    def pause(self, *, update_speaking: bool = True):
+        self.paused = True
+        self.silence = 5
+        if update_speaking:
+            self.speak(discord.SpeakingState.none)
+
+    def resume(self, *, update_speaking: bool = True):
+        self.paused = False
+        if update_speaking:
+            self.speak(discord.SpeakingState.voice)
+
+    def set_source(self, source: discord.AudioSource):
+        self.frames.clear()
+        self.source = source
+        self.encode = not source.is_opus()
+        self.eof = False
+
+    def speak(self, state: discord.SpeakingState):
+        try:
+            asyncio.run_coroutine_threadsafe(self.client.ws.speak(state), client.loop)
+        except Exception as e:
+            print(f"Konnte Sprechstatus nicht setzen: {e}")
+
+    def refill(self, frames: int):
+        """Läuft in einem Reader-Thread und füllt den Vorlauf auf."""
+        cpu_start = time.thread_time()
+        try:
+            while len(self.frames) < frames and not self.ended and not self.eof:
+                if self.frames and self.pipe and not pipe_ready(self.pipe):
+                    break  # ffmpeg hängt hinterher, nicht auf Kosten der anderen Verbindungen warten
+                data = self.source.read()
+                if not data:
+                    self.eof = True
+                elif self.encode:
+                    self.frames.append(self.client.encoder.encode(data, discord.opus.Encoder.SAMPLES_PER_FRAME))
+                else:
+                    self.frames.append(data)
+            self.started = True
+        except Exception as e:
+            self.error = e
+            self.eof = True
+        finally:
+            self.cpu += time.thread_time() - cpu_start
+            self.refilling = False
+
+    def finish(self):
+        """Läuft wie am Ende von AudioPlayer.run: erst after, dann cleanup der Quelle."""
+        if hasattr(self.source, "thread_cpu"):
+            self.source.thread_cpu = self.cpu  # read() misst sonst über wechselnde Reader-Threads hinweg
+        if self.after:
+            try:
+                self.after(self.error)
+            except Exception as e:
+                print(f"Fehler im after-Callback: {e}")
+        while self.refilling:
+            time.sleep(0.005)  # ein Reader-Thread liest gerade noch aus der Quelle
+        self.source.cleanup()
+
+
+class AudioScheduler:
+    """Ein gemeinsamer 20ms-Takt für alle Sprachverbindungen statt eines Threads pro Verbindung.
+
+    Pro Takt wird von jeder aktiven Verbindung ein vorgelesener Frame gesendet. Das Lesen
+    von ffmpeg (und bei PCM das Kodieren) übernimmt ein kleiner fester Pool von Reader-Threads,
+    damit eine hängende Quelle nicht den Takt für alle anderen aufhält. Pro Server werden
+    verpasste Frame-Fristen gezählt: "late", wenn der ganze Takt zu spät kam, "underrun",
+    wenn zum Takt kein Frame vorgelesen war.
+    """
+
+    def __init__(self, readers: int, buffer_frames: int, interval: float = 0.02):
+        self.readers = readers
+        self.buffer_frames = buffer_frames
+        self.interval = interval
+        self.playbacks = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.refills = SimpleQueue()
+        self.finisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-after")
+        self.thread = None
+        self.guilds = {}  # Guild-ID -> Zähler, bleiben über Songwechsel hinweg erhalten
+        self.ticks = 0
+        self.late_ticks = 0
+
+    def guild_stats(self, guild_id: int) -> dict:
+        with self.lock:
+            return self.guilds.setdefault(guild_id, {"frames": 0, "late": 0, "underrun": 0})
+
+    def start(self):
+        if self.thread:
+            return
+        for index in range(self.readers):
+            threading.Thread(target=self.read_loop, name=f"audio-reader-{index}", daemon=True).start()
+        self.thread = threading.Thread(target=self.tick_loop, name="audio-scheduler", daemon=True)
+        self.thread.start()
+
+    def play(self, voice_client: discord.VoiceClient, source: discord.AudioSource, after=None):
+        """Wie VoiceClient.play, nur dass die Verbindung am gemeinsamen Takt hängt."""
+        if not voice_client.is_connected():
+            raise discord.ClientException("Not connected to voice.")
+        if voice_client.is_playing():
+            raise discord.ClientException("Already playing audio.")
+        if not source.is_opus():
+            voice_client.encoder = discord.opus.Encoder(bitrate=PLAYBACK_BITRATE, signal_type="music")
+        playback = ScheduledPlayback(self, voice_client, source, after)
+        # VoiceClient bietet keinen öffentlichen Weg, den Player zu ersetzen. Über _player laufen dort
+        # is_playing, is_paused, stop, pause, resume und source/set_source, siehe ScheduledPlayback.
+        voice_client._player = playback
+        self.start()
+        playback.speak(discord.SpeakingState.voice)
+        self.request_refill(playback)
+        with self.lock:
+            self.playbacks.append(playback)
+        self.wakeup.set()
+
+    def request_refill(self, playback: ScheduledPlayback):
+        if playback.refilling or playback.eof:
+            return
+        if not playback.started and playback.pipe and not pipe_ready(playback.pipe, AUDIO_START_BYTES):
+            # ffmpeg verbindet sich noch, ein Reader-Thread würde bis dahin für alle anderen blockieren
+            return
+        playback.refilling = True
+        self.refills.put(playback)
+
+    def read_loop(self):
+        while True:
+            self.refills.get().refill(self.buffer_frames)
+
+    def tick_loop(self):
+        next_tick = time.perf_counter()
+        while True:
+            with self.lock:
+                playbacks = list(self.playbacks)
+            if not playbacks:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                next_tick = time.perf_counter()
+                continue
+
+            cpu_start, started = time.thread_time(), time.perf_counter()
+            late = started - next_tick > self.interval
+            self.late_ticks += late
+            sent = [playback for playback in playbacks if self.step(playback, late)]
+            if sent:
+                cpu = (time.thread_time() - cpu_start) / len(sent)
+                for playback in sent:
+                    playback.cpu += cpu
+            audio_tick_duration.observe(time.perf_counter() - started)
+            self.ticks += 1
+
+            next_tick += self.interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif -delay > 5 * self.interval:
+                next_tick = time.perf_counter()  # nach einem längeren Hänger nicht im Eiltempo nachholen
+
+    def step(self, playback: ScheduledPlayback, late: bool) -> bool:
+        """Sendet einen Frame einer Verbindung. Gibt True zurück, wenn etwas gesendet wurde."""
+        voice_client = playback.client
+        if playback.ended or (playback.eof and not playback.frames):
+            self.remove(playback)
+            return False
+        if not voice_client.is_connected():
+            return False  # während eines Reconnects nichts verwerfen
+        try:
+            if playback.paused:
+                if not playback.silence:
+                    return False
+                playback.silence -= 1
+                voice_client.send_audio_packet(OPUS_SILENCE, encode=False)
+                return True
+            if not playback.frames:
+                if playback.started:  # bis zum ersten Frame läuft noch keine Frist
+                    playback.stats["underrun"] += 1
+                self.request_refill(playback)
+                return False
+            voice_client.send_audio_packet(playback.frames.popleft(), encode=False)
+        except Exception as e:
+            playback.error = e
+            playback.stop()
+            return False
+        playback.stats["frames"] += 1
+        playback.stats["late"] += late
+        if len(playback.frames) < self.buffer_frames // 2:
+            self.request_refill(playback)
+        return True
+
+    def remove(self, playback: ScheduledPlayback):
+        with self.lock:
+            self.playbacks.remove(playback)
+        playback.ended = True
+        playback.speak(discord.SpeakingState.none)
+        if playback.client.is_connected():
+            for _ in range(5):
+                playback.client.send_audio_packet(OPUS_SILENCE, encode=False)
+        self.finisher.submit(playback.finish)
+
+    def stats(self) -> dict:
+        with self.lock:
+            guilds = {guild_id: dict(stats) for guild_id, stats in self.guilds.items()}
+            active = len(self.playbacks)
+        frames = sum(stats["frames"] for stats in guilds.values())
+        missed = sum(stats["late"] + stats["underrun"] for stats in guilds.values())
+        return {
+            "active": active,
+            "readers": self.readers,
+            "ticks": self.ticks,
+            "late_ticks": self.late_ticks,
+            "frames": frames,
+            "missed": missed,
+            "guilds": guilds,
+        }
+
+
+def play_audio(voice_client: discord.VoiceClient, source: discord.AudioSource, after):
+    if AUDIO_SCHEDULER == "shared":
+        audio_scheduler.play(voice_client, source, after)
+    else:
+        voice_client.play(source, after=after, bitrate=PLAYBACK_BITRATE, signal_type="music")
+
+
+audio_scheduler = AudioScheduler(AUDIO_READER_THREADS, AUDIO_BUFFER_FRAMES)
+if AUDIO_SCHEDULER == "shared" and discord.__version__ != AUDIO_SCHEDULER_DISCORD_VERSION:
+    print(
+        f"AUDIO_SCHEDULER=shared ist nur mit discord.py {AUDIO_SCHEDULER_DISCORD_VERSION} geprüft "
+        f"(installiert: {discord.__version__}), verwende threads."
+    )
+    AUDIO_SCHEDULER = "threads"
+
+
+# --- Nahtlose Übergänge ---
+def discard_prewarmed(guild_id: int):
+    """Beendet einen vorgewärmten ffmpeg-Prozess, z.B. weil sich die Warteschlange geändert hat."""
+    player = guild_players.get(guild_id)
+    if player and player.prewarmed:
+        _, source = player.prewarmed
+        player.prewarmed = None
+        source.cleanup()
+
+
+def take_prewarmed(guild_id: int, track: Track):
+    """Gibt die vorgewärmte Quelle zurück, falls sie zu track gehört, sonst wird sie verworfen."""
+    player = get_player(guild_id)
+    if not player.prewarmed:
+        return None
+    if player.prewarmed[0] is not track:
+        discard_prewarmed(guild_id)
+        return None
+    _, source = player.prewarmed
+    player.prewarmed = None
+    return source
+
+
+async def prewarm_next(guild: discord.Guild, current_source: MeasuredSource, duration: float):
+    """Startet PREWARM_SECONDS vor Songende ffmpeg für den nächsten Song, damit dessen
+    Verbindungsaufbau und Puffer schon fertig sind, wenn der aktuelle Song endet."""
+    while True:
+        voice_client = guild.voice_client
+        if not voice_client or voice_client.source is not current_source:
+            return
+        remaining = duration - current_source.position
+        if remaining <= PREWARM_SECONDS:
+            break
+        await asyncio.sleep(min(remaining - PREWARM_SECONDS, 5))
+
+    player = get_player(guild.id)
+    upcoming = player.upcoming(1)
+    if not upcoming or player.prewarmed:
+        return
+    track = upcoming[0]
+    if not audio_cache.has(track) and not await ensure_stream_url(track, PRIORITY_BACKGROUND):
+        return
+    if not guild.voice_client or guild.voice_client.source is not current_source or player.upcoming(1) != [track]:
+        return
+    source = await create_audio_source(track)
+    source.prewarmed = True
+    discard_prewarmed(guild.id)
+    player.prewarmed = (track, source)
+
+
+# --- Gebündelte Aktualisierung der "Spiele jetzt"-Nachricht ---
+ui_stats = {"requested": 0, "delivered": 0, "sent": 0, "unchanged": 0, "rate_limit_waits": 0, "bulk_deleted": 0}
+channel_next_edit = {}
+
+
+async def wait_for_channel(channel_id: int):
+    """Hält pro Kanal UI_MIN_EDIT_INTERVAL zwischen zwei REST-Aufrufen ein, damit wir nicht
+    in Discords Rate-Limit laufen und die Button-Antworten davon ausgebremst werden."""
+    now = time.monotonic()
+    slot = max(now, channel_next_edit.get(channel_id, 0))
+    channel_next_edit[channel_id] = slot + UI_MIN_EDIT_INTERVAL
+    if slot > now:
+        ui_stats["rate_limit_waits"] += 1
+        await asyncio.sleep(slot - now)
+
+
+class NowPlayingUpdater:
+    """Sammelt Änderungen an der "Spiele jetzt"-Nachricht eines Servers.
+
+    Bei schnellem Überspringen wird nur der letzte Stand gesendet. Die Nachricht wird nur
+    bearbeitet, wenn sich ihr Text geändert hat, und die Buttons (eine MusicControlsView pro
+    Server) werden nur beim Erstellen der Nachricht mitgeschickt.
+    """
+
+    def __init__(self, player: GuildPlayer):
+        self.player = player
+        self.pending = None  # (Text, Kanal)
+        self.task = None
+        self.last_content = None
+
+    def show(self, content: str, channel: discord.abc.Messageable):
+        ui_stats["requested"] += 1
+        self.pending = (content, channel)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        await asyncio.sleep(UI_DEBOUNCE)
+        while self.pending:
+            content, channel = self.pending
+            self.pending = None
+            if content == self.last_content and self.player.now_playing_message:
+                ui_stats["unchanged"] += 1
+                continue
+            await self._send(content, channel)
+
+    async def _send(self, content: str, channel: discord.abc.Messageable):
+        msg = self.player.now_playing_message
+        if msg:
+            try:
+                await wait_for_channel(msg.channel.id)
+                await msg.edit(content=content)
+                ui_stats["sent"] += 1
+                ui_stats["delivered"] += 1
+                self.last_content = content
+                return
+            except discord.errors.NotFound as e:
+                print(f"Konnte 'Now Playing'-Nachricht nicht finden/bearbeiten, sende neue. Fehler: {e}")
+            except discord.errors.HTTPException as e:
+                print(f"Konnte 'Now Playing'-Nachricht nicht bearbeiten. Fehler: {e}")
+                return
+
+        if self.player.controls_view is None:
+            self.player.controls_view = MusicControlsView()
+        try:
+            await wait_for_channel(channel.id)
+            msg = await channel.send(content, view=self.player.controls_view)
+            self.player.now_playing_message = msg
+            self.last_content = content
+            ui_stats["sent"] += 1
+            ui_stats["delivered"] += 1
+            await wait_for_channel(channel.id)
+            await msg.pin()
+            ui_stats["sent"] += 1
+        except Exception as e:
+            print(f"Konnte keine neue 'Now Playing'-Nachricht senden. Fehler: {e}")
+
+    async def finish(self):
+        """Verwirft ausstehende Änderungen, löst die Nachricht und entfernt ihre Buttons."""
+        self.pending = None
+        if self.task and not self.task.done():
+            self.task.cancel()
+        msg, self.player.now_playing_message = self.player.now_playing_message, None
+        if self.player.controls_view:
+            self.player.controls_view.stop()  # sonst bleibt die View für immer im ViewStore von discord.py
+        self.player.controls_view = None
+        self.last_content = None
+        if not msg:
+            return
+        try:
+            await wait_for_channel(msg.channel.id)
+            await msg.unpin()
+            await wait_for_channel(msg.channel.id)
+            await msg.edit(view=None)
+            ui_stats["sent"] += 2
+        except discord.errors.HTTPException as e:
+            print(f"Konnte 'Now Playing'-Nachricht nicht lösen. Fehler: {e}")
+
+
+def now_playing(player: GuildPlayer) -> NowPlayingUpdater:
+    if player.now_playing_updater is None:
+        player.now_playing_updater = NowPlayingUpdater(player)
+    return player.now_playing_updater
+
+
+async def remove_old_pins(interaction: discord.Interaction):
+    current = get_player(interaction.guild.id).now_playing_message
+    old_pins = [pin async for pin in interaction.channel.pins(limit=None)
+                if pin.author.id == client.application_id and (current is None or pin.id != current.id)]
+
+    # Nachrichten jünger als 14 Tage lassen sich mit einem Aufruf pro 100 Stück löschen
+    bulk = []
+    if len(old_pins) > 1 and interaction.channel.permissions_for(interaction.guild.me).manage_messages:
+        cutoff = discord.utils.utcnow() - timedelta(days=14)
+        bulk = [pin for pin in old_pins if pin.created_at > cutoff]
+    for start in range(0, len(bulk), 100):
+        chunk = bulk[start:start + 100]
+        await wait_for_channel(interaction.channel.id)
+        await interaction.channel.delete_messages(chunk)
+        ui_stats["bulk_deleted"] += len(chunk) - 1
+
+    bulk_ids = {pin.id for pin in bulk}
+    for pin in old_pins:
+        if pin.id not in bulk_ids:
+            await wait_for_channel(interaction.channel.id)
+            await pin.delete()
 
 
 # --- Die View-Klasse für die Steuerungs-Buttons ---
@@ -219,32 +2718,38 @@ class MusicControlsView(ui.View):
     def __init__(self):
         super().__init__(timeout=None)
 
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        await ensure_restored(interaction.guild_id)
+        return True
+
 
     @ui.button(label="Loop", style=discord.ButtonStyle.secondary, emoji="🔄")
     async def loop_button(self, interaction: discord.Interaction, button: ui.Button):
         voice_client = interaction.guild.voice_client
-        if not voice_client or not (voice_client.is_playing() or voice_client.is_paused()) or not music_queues.get(interaction.guild.id):
+        if not voice_client or not (voice_client.is_playing() or voice_client.is_paused()) or interaction.guild.id not in guild_players:
             await interaction.response.send_message("Es wird gerade nichts abgespielt.", ephemeral=True)
             return
 
-        loop = music_queues[interaction.guild.id].get("Loop")
-        if loop is not True:
-            music_queues[interaction.guild.id]["Loop"] = True
+        player = get_player(interaction.guild.id)
+        if not player.loop:
+            player.loop = True
             await interaction.response.send_message("Endlosschleife ist jetzt aktiviert", ephemeral=True)
         else:
-            music_queues[interaction.guild.id]["Loop"] = False
+            player.loop = False
             await interaction.response.send_message("Endlosschleife ist jetzt deaktiviert", ephemeral=True)
 
     @ui.button(label="Prev", style=discord.ButtonStyle.secondary, emoji="⏮️")
     async def prev_button(self, interaction: discord.Interaction, button: ui.Button):
         voice_client = interaction.guild.voice_client
         if voice_client:
-            if len(music_queues[interaction.guild.id]["prev_songs"]) < 2:
+            player = get_player(interaction.guild.id)
+            if len(player.history) < 2:
                 await interaction.response.send_message("Es gibt keinen vorherigen Song", ephemeral=True)
                 return
-            music_queues[interaction.guild.id]["queue"].insert(0, music_queues[interaction.guild.id]["prev_songs"].pop(-1))
+            discard_prewarmed(interaction.guild.id)
+            player.step_back()
             if voice_client and voice_client.is_playing():
-                music_queues[interaction.guild.id]["queue"].insert(0, music_queues[interaction.guild.id]["prev_songs"].pop(-1))
+                player.step_back()
                 voice_client.stop()
             await interaction.response.send_message("Zum vorherigen Song gesprungen", ephemeral=True)
         else:
@@ -280,32 +2785,364 @@ class MusicControlsView(ui.View):
     @ui.button(label="Stop", style=discord.ButtonStyle.danger, emoji="⏹️")
     async def stop_button(self, interaction: discord.Interaction, button: ui.Button):
         guild_id = interaction.guild.id
-        if guild_id in music_queues:
-            music_queues[guild_id]["queue"].clear()
-            music_queues[guild_id]["prev_songs"].clear()
+        player = get_player(guild_id)
+        discard_prewarmed(guild_id)
+        player.clear()
 
         voice_client = interaction.guild.voice_client
         if voice_client and voice_client.is_connected():
             voice_client.stop()
             await voice_client.disconnect()
             await interaction.response.send_message("Wiedergabe gestoppt und Warteschlange geleert.", ephemeral=True)
-            msg = music_queues[guild_id]["now_playing_message"]
-            await msg.unpin()
-            await msg.edit(view=None)
-            music_queues[guild_id].pop("now_playing_message")
+            await now_playing(player).finish()
         else:
             await interaction.response.send_message("Nichts zu stoppen.", ephemeral=True)
 
 
+# --- Aufräumen untätiger Server ---
+reaper_stats = {"disconnected": 0, "compacted_bytes": 0, "evicted": 0, "evicted_bytes": 0, "ffmpeg_killed": 0}
+
+
+def active_ffmpeg_pids() -> set[int]:
+    """PIDs der ffmpeg-Prozesse, die zu einer laufenden oder vorgewärmten Quelle gehören."""
+    sources = [voice_client.source for voice_client in client.voice_clients]
+    sources += [player.prewarmed[1] for player in guild_players.values() if player.prewarmed]
+    pids = shared_sources.pids() | loudness_analyzer.pids
+    for source in sources:
+        process = getattr(getattr(source, "source", source), "_process", None)
+        if process:
+            pids.add(process.pid)
+    return pids
+
+
+def kill_orphaned_ffmpeg() -> int:
+    """Beendet von Audioquellen gestartete ffmpeg-Prozesse, zu denen es keine Quelle mehr gibt
+    (z.B. nach abgebrochenen Verbindungen). Andere ffmpeg-Kindprozesse, etwa von yt-dlp, bleiben unberührt."""
+    active = active_ffmpeg_pids()
+    children = child_processes("ffmpeg")
+    spawned_ffmpeg.intersection_update(pid for pid, _ in children)  # beendete Prozesse vergessen
+    killed = 0
+    for pid, age in children:
+        if pid not in spawned_ffmpeg or pid in active or age < FFMPEG_ORPHAN_GRACE:
+            continue
+        try:
+            os.kill(pid, signal.SIGKILL)
+            killed += 1
+        except OSError:
+            pass
+    reaper_stats["ffmpeg_killed"] += killed
+    return killed
+
+
+async def disconnect_idle(voice_client: discord.VoiceClient, player: GuildPlayer):
+    if voice_client.is_paused() and player.current:
+        player.step_back()  # der angehaltene Song beginnt beim nächsten Mal von vorne
+        player.rewound = True
+    player.stopping = True
+    discard_prewarmed(voice_client.guild.id)
+    await voice_client.disconnect()
+    await now_playing(player).finish()
+    reaper_stats["compacted_bytes"] += player.compact()
+    reaper_stats["disconnected"] += 1
+
+
+async def evict_dormant(guild_ids: list[int]):
+    """Lagert die Zustände lange untätiger Server als Schnappschuss aus, ensure_restored holt sie zurück."""
+    fingerprints = {guild_id: guild_players[guild_id].fingerprint() for guild_id in guild_ids}
+    # Ausgelagert wird nur nach dem Trennen, ein angehaltener Song liegt dann schon wieder in der Warteschlange
+    snapshots = [(guild_id, snapshot_player(guild_players[guild_id], False)) for guild_id in guild_ids]
+    if not await metadata_store.save_snapshots(snapshots):
+        # Ohne Datenbank nur leere Zustände verwerfen, sonst ginge die Warteschlange verloren
+        guild_ids = [guild_id for guild_id, snapshot in snapshots if snapshot is None]
+    for guild_id in guild_ids:
+        player = guild_players.get(guild_id)
+        if player is None or player.fingerprint() != fingerprints[guild_id] or guild_id in restore_tasks:
+            continue  # während des Speicherns wieder benutzt
+        if player.now_playing_message:
+            await now_playing(player).finish()
+        discard_prewarmed(guild_id)
+        reaper_stats["evicted_bytes"] += player.memory_usage()
+        reaper_stats["evicted"] += 1
+        del guild_players[guild_id]
+
+
+async def reap_idle_guilds():
+    now = time.monotonic()
+    for voice_client in list(client.voice_clients):
+        player = get_player(voice_client.guild.id)
+        if voice_client.is_playing():
+            player.touch()
+        elif now - player.last_active >= IDLE_DISCONNECT_SECONDS:
+            print(f"Verlasse Sprachkanal auf Server {voice_client.guild.id} nach {IDLE_DISCONNECT_SECONDS:.0f}s Stille")
+            await disconnect_idle(voice_client, player)
+
+    kill_orphaned_ffmpeg()
+
+    connected = {voice_client.guild.id for voice_client in client.voice_clients}
+    dormant = [guild_id for guild_id, player in guild_players.items()
+               if guild_id not in connected and now - player.last_active >= IDLE_EVICT_SECONDS]
+    if dormant:
+        await evict_dormant(dormant)
+
+
+async def reap_periodically():
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL)
+        try:
+            await reap_idle_guilds()
+        except Exception as e:
+            print(f"Fehler beim Aufräumen untätiger Server: {e}")
+
+
+def format_resource_report(limit: int = 15) -> str:
+    """Speicher und Ressourcen pro Server, die größten zuerst."""
+    now = time.monotonic()
+    voice_clients = {voice_client.guild.id: voice_client for voice_client in client.voice_clients}
+    usage = sorted(((player.memory_usage(), guild_id, player) for guild_id, player in guild_players.items()), reverse=True)
+    lines = [
+        f"**Ressourcen**: {len(guild_players)} Server im Speicher (~{sum(size for size, _, _ in usage) / 1024:.0f} KiB), "
+        f"{len(voice_clients)} Sprachverbindungen, {count_child_processes('ffmpeg')} ffmpeg-Prozesse",
+        f"**Aufgeräumt**: {reaper_stats['disconnected']}x Sprachkanal verlassen, {reaper_stats['evicted']} Server ausgelagert "
+        f"(~{reaper_stats['evicted_bytes'] / 1024:.0f} KiB), {reaper_stats['compacted_bytes'] / 1024:.0f} KiB kompaktiert, "
+        f"{reaper_stats['ffmpeg_killed']} verwaiste ffmpeg-Prozesse beendet",
+    ]
+    for size, guild_id, player in usage[:limit]:
+        guild = client.get_guild(guild_id)
+        voice_client = voice_clients.get(guild_id)
+        if voice_client and voice_client.is_playing():
+            voice = "spielt"
+        elif voice_client:
+            voice = f"verbunden, seit {now - player.last_active:.0f}s still"
+        else:
+            voice = f"nicht verbunden, untätig seit {(now - player.last_active) / 60:.0f} min"
+        counts = audio_scheduler.guilds.get(guild_id)
+        if counts:
+            voice += f", {counts['late'] + counts['underrun']} verpasste Frame-Fristen"
+        lines.append(
+            f"- {guild.name if guild else guild_id}: ~{size / 1024:.1f} KiB, {len(player.queue)} in der Warteschlange, "
+            f"{len(player.history)} im Verlauf, {voice}"
+        )
+    if len(usage) > limit:
+        lines.append(f"... {len(usage) - limit} weitere Server")
+    return "\n".join(lines)
+
+
+# --- Metriken der einzelnen Komponenten ---
+@metrics.collector
+def cache_metrics():
+    caches = {"search": search_cache, "info": info_cache, "playlist": playlist_cache, "stream": stream_cache}
+    hits = {name: cache.hits for name, cache in caches.items()}
+    misses = {name: cache.misses for name, cache in caches.items()}
+    hits["stream_url"], misses["stream_url"] = stream_url_stats["hits"], stream_url_stats["refreshes"]
+    hits["audio"], misses["audio"] = audio_cache.hits, audio_cache.misses
+    for kind in set(metadata_store.hits) | set(metadata_store.misses):
+        hits[f"db_{kind}"] = metadata_store.hits.get(kind, 0)
+        misses[f"db_{kind}"] = metadata_store.misses.get(kind, 0)
+    yield "musicbot_cache_hits_total", "counter", "Treffer pro Cache", [({"cache": name}, value) for name, value in hits.items()]
+    yield "musicbot_cache_misses_total", "counter", "Fehltreffer pro Cache", [({"cache": name}, value) for name, value in misses.items()]
+    yield "musicbot_cache_hit_ratio", "gauge", "Trefferquote pro Cache seit dem Start", [
+        ({"cache": name}, hits[name] / (hits[name] + misses[name]) if hits[name] + misses[name] else 0.0) for name in hits
+    ]
+    yield "musicbot_audio_cache_bytes", "gauge", "Belegter Platz im Audio-Cache", [({}, audio_cache.total_bytes)]
+    yield "musicbot_upload_bytes", "gauge", "Belegter Platz der hochgeladenen Dateien", [({}, upload_store.total_bytes)]
+
+
+@metrics.collector
+def playback_metrics():
+    voice_clients = client.voice_clients
+    yield "musicbot_voice_clients", "gauge", "Verbundene Sprachkanäle", [({}, len(voice_clients))]
+    yield "musicbot_voice_clients_playing", "gauge", "Sprachkanäle, in denen gerade etwas läuft", [
+        ({}, sum(1 for voice_client in voice_clients if voice_client.is_playing()))
+    ]
+    yield "musicbot_ffmpeg_processes", "gauge", "Laufende ffmpeg-Prozesse", [({}, count_child_processes("ffmpeg"))]
+    yield "musicbot_guild_players", "gauge", "Server mit Zustand im Speicher", [({}, len(guild_players))]
+    yield "musicbot_reaper_total", "counter", "Vom Aufräumer verlassene Sprachkanäle, ausgelagerte Server und beendete ffmpeg-Prozesse", [
+        ({"action": "disconnected"}, reaper_stats["disconnected"]),
+        ({"action": "evicted"}, reaper_stats["evicted"]),
+        ({"action": "ffmpeg_killed"}, reaper_stats["ffmpeg_killed"]),
+    ]
+    yield "musicbot_queue_length", "gauge", "Songs in der Warteschlange pro Server", [
+        ({"guild": guild_id}, len(player.queue)) for guild_id, player in guild_players.items()
+    ]
+
+
+@metrics.collector
+def loudness_metrics():
+    if not LOUDNESS_NORMALIZATION:
+        return
+    loudness = loudness_analyzer.stats()
+    yield "musicbot_loudness_analyses_total", "counter", "Lautheitsmessungen nach Ergebnis", [
+        ({"result": "ok"}, loudness["analyzed"]), ({"result": "failed"}, loudness["failed"])
+    ]
+    yield "musicbot_loudness_analyses_running", "gauge", "Laufende und geplante Lautheitsmessungen", [
+        ({"state": "running"}, loudness["running"]), ({"state": "pending"}, loudness["pending"])
+    ]
+    yield "musicbot_loudness_plays_total", "counter", "Wiedergaben nach Herkunft der Verstärkung", [
+        ({"gain": "precomputed"}, loudness["precomputed"]), ({"gain": "fallback"}, loudness["fallback"]),
+        ({"gain": "none"}, loudness["unmeasured"]),
+    ]
+    yield "musicbot_loudness_coverage_ratio", "gauge", "Anteil der Wiedergaben mit gespeicherter Messung", [({}, loudness["coverage"])]
+
+
+@metrics.collector
+def shared_source_metrics():
+    if not SHARED_SOURCES:
+        return
+    shared = shared_sources.stats()
+    yield "musicbot_shared_streams", "gauge", "Laufende geteilte ffmpeg-Pipelines", [({}, shared["streams"])]
+    yield "musicbot_shared_listeners", "gauge", "Wiedergaben, die aus geteilten Pipelines lesen", [({}, shared["listeners"])]
+    yield "musicbot_shared_ffmpeg_saved_total", "counter", "Wiedergaben ohne eigenen ffmpeg-Prozess", [({}, shared["joined"])]
+    yield "musicbot_shared_bytes_total", "counter", "Aus dem Puffer geteilte Audiodaten (kodierte Frames)", [({}, shared["shared_bytes"])]
+    yield "musicbot_shared_buffered_bytes", "gauge", "Gepufferte Frames aller geteilten Pipelines", [({}, shared["buffered_bytes"])]
+
+
+@metrics.collector
+def scheduler_metrics():
+    if AUDIO_SCHEDULER != "shared":
+        return
+    scheduler = audio_scheduler.stats()
+    yield "musicbot_audio_scheduled_connections", "gauge", "Sprachverbindungen am gemeinsamen Audio-Takt", [({}, scheduler["active"])]
+    yield "musicbot_audio_late_ticks_total", "counter", "Takte, die mehr als 20ms zu spät liefen", [({}, scheduler["late_ticks"])]
+    yield "musicbot_audio_frames_total", "counter", "Vom gemeinsamen Audio-Takt gesendete Frames pro Server", [
+        ({"guild": guild_id}, counts["frames"]) for guild_id, counts in scheduler["guilds"].items()
+    ]
+    yield "musicbot_audio_deadline_misses_total", "counter", "Verpasste Frame-Fristen pro Server", [
+        ({"guild": guild_id, "kind": kind}, counts[kind]) for guild_id, counts in scheduler["guilds"].items() for kind in ("late", "underrun")
+    ]
+
+
+@metrics.collector
+def startup_metrics():
+    yield "musicbot_startup_seconds", "gauge", "Sekunden vom Prozessstart bis zur jeweiligen Phase", [
+        ({"phase": phase}, seconds) for phase, seconds in startup_times.items()
+    ]
+
+
+@metrics.collector
+def extraction_metrics():
+    limit_stats = rate_limiter.stats()
+    yield "musicbot_rate_limit_per_second", "gauge", "Aktuelle Rate des YouTube-Rate-Limits", [({}, limit_stats["rate"])]
+    yield "musicbot_rate_limit_throttle_events_total", "counter", "Erkannte Drosselungen durch YouTube", [({}, limit_stats["throttle_events"])]
+    yield "musicbot_extraction_pending", "gauge", "Laufende und wartende yt-dlp-Jobs", [
+        ({"pool": engine.name}, engine.pending) for engine in (extraction_engine, download_engine)
+    ]
+    yield "musicbot_message_edits_total", "counter", "REST-Aufrufe für die \"Spiele jetzt\"-Nachricht", [({}, ui_stats["sent"])]
+
+
+def format_metrics_summary() -> str:
+    """Kurzfassung der Histogramme und Füllstände für /metrics."""
+    lines = []
+    for histogram in metrics.histograms:
+        for label_value in list(histogram.series):
+            name = f"{histogram.name}{{{label_value}}}" if label_value else histogram.name
+            lines.append(
+                f"- `{name}`: {histogram.count(label_value)}x, p50 {histogram.quantile(0.5, label_value) * 1000:.0f}ms, "
+                f"p99 {histogram.quantile(0.99, label_value) * 1000:.0f}ms"
+            )
+    queue_lengths = sorted((len(player.queue) for player in guild_players.values()), reverse=True)
+    playing = sum(1 for voice_client in client.voice_clients if voice_client.is_playing())
+    lines.append(
+        f"**Sprachkanäle**: {len(client.voice_clients)} verbunden, {playing} spielen, "
+        f"{count_child_processes('ffmpeg')} ffmpeg-Prozesse"
+    )
+    lines.append(
+        f"**Warteschlangen**: {len(queue_lengths)} Server, {sum(queue_lengths)} Songs, "
+        f"längste: {', '.join(map(str, queue_lengths[:5])) or '-'}"
+    )
+    return "\n".join(lines) or "Noch keine Messwerte"
+
+
+# --- Blätterbare Wiedergabeliste ---
+class QueuePageView(ui.View):
+    """Blättert durch Verlauf und Warteschlange, jede Seite wird beim Klicken neu gerendert."""
+
+    def __init__(self, player: GuildPlayer):
+        super().__init__(timeout=300)
+        self.player = player
+        self.start = self.now_playing_start()
+
+    def now_playing_start(self) -> int:
+        # Zwei Songs Verlauf als Kontext über dem aktuellen Song
+        return max(0, len(self.player.history) - 3)
+
+    def render(self) -> str:
+        content, self.start = render_queue_page(self.player, self.start)
+        total = len(self.player.history) + len(self.player.queue)
+        self.prev_page_button.disabled = self.start == 0
+        self.next_page_button.disabled = self.start + QUEUE_PAGE_SIZE >= total
+        return content
+
+    async def show(self, interaction: discord.Interaction, start: int):
+        self.start = start
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+    @ui.button(label="Zurück", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def prev_page_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.show(interaction, max(0, self.start - QUEUE_PAGE_SIZE))
+
+    @ui.button(label="Jetzt läuft", style=discord.ButtonStyle.primary, emoji="🎵")
+    async def now_playing_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.show(interaction, self.now_playing_start())
+
+    @ui.button(label="Weiter", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def next_page_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.show(interaction, self.start + QUEUE_PAGE_SIZE)
+
+
 # --- Bot-Klasse und Events ---
+class MusicCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.type is not discord.InteractionType.autocomplete:
+            await ensure_restored(interaction.guild_id)
+        return True
+
+
 class MyClient(discord.Client):
     def __init__(self, *, intents: discord.Intents):
         super().__init__(intents=intents)
-        self.tree = discord.app_commands.CommandTree(self)
+        self.tree = MusicCommandTree(self)
+
+    async def setup_hook(self):
+        asyncio.create_task(metadata_store.compact_periodically())
+        asyncio.create_task(snapshot_periodically())
+        asyncio.create_task(monitor_event_loop_lag())
+        asyncio.create_task(reap_periodically())
+        self.metrics_runner = await start_metrics_server()
+        # Einmal pro Prozess, on_ready kommt auch nach jeder neuen Gateway-Verbindung
+        try:
+            self.commands_synced = await self.sync_commands()
+        except discord.HTTPException as e:
+            print(f"Konnte die Befehle nicht synchronisieren: {e}")
+            self.commands_synced = False
+        # Bei einem Neustart des Containers vor dem Beenden noch einen Schnappschuss speichern
+        self.loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+
+    async def sync_commands(self) -> bool:
+        """Synchronisiert die Slash-Befehle nur, wenn sich ihre Definition seit der letzten
+        Synchronisierung geändert hat. Discord begrenzt tree.sync() stark."""
+        payload = [command.to_dict(self.tree) for command in self.tree.get_commands()]
+        digest = hashlib.sha256(json.dumps([self.application_id, payload], sort_keys=True).encode()).hexdigest()
+        if await metadata_store.get_setting("command_tree_hash") == digest:
+            return False
+        await self.tree.sync()
+        await metadata_store.set_setting("command_tree_hash", digest)
+        return True
+
+    async def close(self):
+        await snapshot_players()
+        await upload_store.close()
+        if getattr(self, "metrics_runner", None):
+            await self.metrics_runner.cleanup()
+        await super().close()
 
     async def on_ready(self):
-        await self.tree.sync()
-        print(f'Eingeloggt als {self.user} und Befehle synchronisiert!')
+        if "ready" in startup_times:
+            print(f"Erneut mit dem Gateway verbunden als {self.user}")
+            return
+        startup_times["ready"] = process_uptime()
+        self.loop.run_in_executor(None, load_yt_dlp)
+        print(f"Eingeloggt als {self.user}, bereit nach {startup_times['ready']:.2f}s "
+              f"(Import {startup_times['import']:.2f}s, Befehle {'synchronisiert' if self.commands_synced else 'unverändert'})")
 
 
 intents = discord.Intents.default()
@@ -314,24 +3151,57 @@ client = MyClient(intents=intents)
 
 
 # --- Die Wiedergabefunktion ---
+async def report_playback_stalled(guild: discord.Guild, player: GuildPlayer, initial_interaction: discord.Interaction,
+                                  track: Track, error_class: str, failures: int):
+    """Meldet im Textkanal, dass die Wiedergabe wegen nicht auflösbarer Songs angehalten wurde."""
+    if error_class == "permanent":
+        content = f"⚠️ {failures} Songs in Folge konnten nicht geladen werden, die Wiedergabe ist angehalten."
+    else:
+        reason = "YouTube drosselt gerade" if error_class == "throttled" else "Netzwerkfehler"
+        content = f"⚠️ **{track.title}** konnte nicht geladen werden ({reason}), die Wiedergabe ist angehalten."
+    content += f" Die Warteschlange ({len(player.queue)} Songs) bleibt erhalten, mit /play geht es weiter."
+    channel = initial_interaction.channel if initial_interaction else guild.text_channels[0]
+    try:
+        await wait_for_channel(channel.id)
+        await channel.send(content)
+    except Exception as e:
+        print(f"Konnte die Warnung nicht senden. Fehler: {e}")
+
+
 async def play_next_in_queue(guild: discord.Guild, initial_interaction: discord.Interaction = None):
     """Spielt den nächsten Song ab. Wird vom "after"-Callback immer wieder aufgerufen."""
     guild_id = guild.id
-    if not music_queues[guild_id].get("prev_songs"):
-        music_queues[guild_id]["prev_songs"] = []
-    if guild_id in music_queues and music_queues[guild_id]["queue"] or music_queues[guild_id].get("current_song"):
-        if music_queues[guild_id].get("Loop") is not True:
-            current_song_info = music_queues[guild_id]["queue"].pop(0)
-            music_queues[guild_id]["prev_songs"].append(current_song_info)
-            if len(music_queues[guild_id]["prev_songs"]) >= MAX_PREV_SONGS_SIZE:
-                music_queues[guild_id]["prev_songs"].pop(0)
+    player = get_player(guild_id)
+    if player.has_next():
+        if not player.loop:
+            failures = 0
+            while True:
+                current_song_info = player.queue.popleft()
+                if audio_cache.has(current_song_info) or await ensure_stream_url(current_song_info):
+                    break
+                failures += 1
+                error_class = stream_cache.negative.get(current_song_info.webpage_url, "permanent")
+                if error_class == "permanent":
+                    print(f"Konnte '{current_song_info.title}' nicht auflösen, überspringe.")
+                    if failures < RESOLVE_FAILURE_LIMIT and player.queue:
+                        continue
+                else:
+                    # Netzwerkfehler oder Drosselung: Song behalten, statt die ganze Warteschlange zu verwerfen
+                    player.queue.appendleft(current_song_info)
+                if player.queue:
+                    await report_playback_stalled(guild, player, initial_interaction, current_song_info, error_class, failures)
+                return
+            if guild.voice_client and (guild.voice_client.is_playing() or guild.voice_client.is_paused()):
+                # Während der Auflösung wurde bereits ein anderer Song gestartet
+                player.queue.appendleft(current_song_info)
+                return
+            player.history.append(current_song_info)
         else:
-            current_song_info = music_queues[guild_id]["prev_songs"][-1]
+            current_song_info = player.current
+            if not audio_cache.has(current_song_info) and not await ensure_stream_url(current_song_info):
+                print(f"Konnte '{current_song_info.title}' nicht erneut auflösen.")
+                return
 
-        if current_song_info["url"].startswith("temp_audio/"):
-            source = discord.FFmpegPCMAudio(current_song_info['url'])
-        else:
-            source = discord.FFmpegPCMAudio(current_song_info['url'], **FFMPEG_OPTIONS)
         voice_client = guild.voice_client
 
         if not voice_client:
@@ -344,30 +3214,24 @@ async def play_next_in_queue(guild: discord.Guild, initial_interaction: discord.
             else:
                 return
 
-        after_callback = lambda e: client.loop.create_task(play_next_in_queue(guild, initial_interaction))
-        voice_client.play(source, after=after_callback, bitrate=256, signal_type="music")
+        source = take_prewarmed(guild_id, current_song_info) or await create_audio_source(current_song_info)
+        source.started_after, player.track_ended = player.track_ended, None
 
-        content = f"▶️ Spiele jetzt: **{current_song_info['title']} - {current_song_info['artist']}**  `[{current_song_info['duration_string']}]`"
-        view = MusicControlsView()
+        def after_callback(error):
+            player.track_ended = time.perf_counter()
+            if player.stopping:
+                return
+            asyncio.run_coroutine_threadsafe(play_next_in_queue(guild, initial_interaction), client.loop)
 
-        try:
-            if initial_interaction and not initial_interaction.response.is_done():
-                await initial_interaction.followup.send(content, view=view)
-                msg = await initial_interaction.original_response()
-                music_queues[guild_id]["now_playing_message"] = msg
-                await msg.pin()
-            elif "now_playing_message" in music_queues[guild_id]:
-                msg = music_queues[guild_id]["now_playing_message"]
-                await msg.edit(content=content, view=view)
-        except (discord.errors.NotFound, AttributeError) as e:
-            print(f"Konnte 'Now Playing'-Nachricht nicht finden/bearbeiten, sende neue. Fehler: {e}")
-            channel = initial_interaction.channel if initial_interaction else guild.text_channels[0]
-            try:
-                msg = await channel.send(content, view=view)
-                music_queues[guild_id]["now_playing_message"] = msg
-                await msg.pin()
-            except Exception as e:
-                print(f"Konnte keine neue 'Now Playing'-Nachricht senden. Fehler: {e}")
+        player.stopping = player.rewound = False
+        play_audio(voice_client, source, after_callback)
+        prefetch_upcoming(guild_id)
+        if current_song_info.duration:
+            asyncio.create_task(prewarm_next(guild, source, current_song_info.duration))
+
+        content = f"▶️ Spiele jetzt: **{current_song_info.title} - {current_song_info.artist}**  `[{current_song_info.duration_string}]`"
+        channel = initial_interaction.channel if initial_interaction else guild.text_channels[0]
+        now_playing(player).show(content, channel)
 
 
 # --- Slash-Befehle ---
@@ -389,16 +3253,17 @@ async def join(interaction: discord.Interaction):
 async def play(interaction: discord.Interaction, query: str):
     await interaction.response.defer(thinking=True)
 
-    info = get_info(query)
+    info = await extraction_engine.get_info(query)
     if not info:
         await interaction.followup.send("Konnte den Song nicht finden oder der Song ist Altersbeschränkt.", ephemeral=True)
         return
 
-    guild_id = interaction.guild.id
-    if guild_id not in music_queues:
-        music_queues[guild_id] = {"queue": [], "now_playing_message": None}
+    player = get_player(interaction.guild.id)
+    if not player.free_slots():
+        await interaction.followup.send(f"Die Warteschlange ist voll (maximal {MAX_QUEUE_SIZE} Songs).", ephemeral=True)
+        return
 
-    music_queues[guild_id]["queue"].append(minimize_info(info))
+    player.queue.append(minimize_info(info))
     await interaction.followup.send(f"Zur Warteschlange hinzugefügt: **{info.get('title')}**")
 
     voice_client = interaction.guild.voice_client
@@ -412,31 +3277,25 @@ async def play(interaction: discord.Interaction, query: str):
 async def play_album(interaction: discord.Interaction, query: str):
     await interaction.response.defer(ephemeral=True, thinking=True)
 
-    info = get_playlist_info(query)
+    info = await extraction_engine.get_playlist_info(query)
     if not info:
         return
 
     guild_id = interaction.guild.id
-    if guild_id not in music_queues:
-        music_queues[guild_id] = {"queue": [], "now_playing_message": None}
-
-    for entry in info[1]:
-        x = time.time()
-        song_info = get_info(entry["url"])
-        time_delta = time.time() - x
-        print(f"Ladezeit {time_delta:.2f} sekunden")
-        if not song_info:
-            await interaction.followup.send("Konnte den Song nicht finden oder der Song ist Altersbeschränkt.", ephemeral=True)
-            if time_delta > 0.1:
-                await asyncio.sleep(5 + random.randint(-50, 50) / 100)
-            continue
-        music_queues[guild_id]["queue"].append(minimize_info(song_info))
+    player = get_player(guild_id)
 
-        voice_client = interaction.guild.voice_client
-        if not voice_client or not voice_client.is_playing():
-            await play_next_in_queue(interaction.guild, initial_interaction=interaction)
-        if time_delta > 0.1:
-            await asyncio.sleep(5 + random.randint(-50, 50) / 100)
+    # Die flachen Einträge enthalten schon Titel, Kanal und Dauer. Die Stream-URLs werden erst
+    # kurz vor dem Abspielen aufgelöst (siehe prefetch_upcoming).
+    entries = [entry for entry in info[1] if entry and entry.get("url")]
+    if len(entries) > player.free_slots():
+        await interaction.followup.send(f"Die Warteschlange ist voll, nur {player.free_slots()} von {len(entries)} Songs werden hinzugefügt.", ephemeral=True)
+    player.queue.extend(minimize_flat_entry(entry) for entry in entries[:player.free_slots()])
+
+    voice_client = interaction.guild.voice_client
+    if not voice_client or not voice_client.is_playing():
+        await play_next_in_queue(interaction.guild, initial_interaction=interaction)
+    else:
+        prefetch_upcoming(guild_id)
 
     await interaction.followup.send(f"Zur Warteschlange hinzugefügt: **{info[0]}**")
 
@@ -446,16 +3305,19 @@ async def play_album(interaction: discord.Interaction, query: str):
 @app_commands.autocomplete(query=get_songs)
 async def play_next(interaction: discord.Interaction, query: str):
     await interaction.response.defer(ephemeral=True, thinking=True)
-    info = get_info(query)
+    info = await extraction_engine.get_info(query)
     if not info:
         await interaction.followup.send("Konnte den Song nicht finden oder der Song ist Altersbeschränkt.", ephemeral=True)
         return
 
     guild_id = interaction.guild.id
-    if guild_id not in music_queues:
-        music_queues[guild_id] = {"queue": [], "now_playing_message": None}
+    player = get_player(guild_id)
+    if not player.free_slots():
+        await interaction.followup.send(f"Die Warteschlange ist voll (maximal {MAX_QUEUE_SIZE} Songs).", ephemeral=True)
+        return
 
-    music_queues[guild_id]["queue"].insert(0, minimize_info(info))
+    discard_prewarmed(guild_id)
+    player.queue.appendleft(minimize_info(info))
     await interaction.followup.send(f"Als nächstes zur Warteschlange hinzugefügt: **{info.get('title')}**")
 
     voice_client = interaction.guild.voice_client
@@ -467,17 +3329,26 @@ async def play_next(interaction: discord.Interaction, query: str):
 @app_commands.describe(datei="Die Audiodatei, die du abspielen möchtest.")
 async def play_file(interaction: discord.Interaction, datei: discord.Attachment):
     await interaction.response.defer(ephemeral=True, thinking=True)
-    file_path = f"temp_audio/{datei.filename}"
-    await datei.save(file_path)
-    if not music_queues.get(interaction.guild.id):
-        music_queues[interaction.guild.id] = {"queue": [], "now_playing_message": None}
-    music_queues[interaction.guild.id]["queue"].append(minimize_info({
-        "url": file_path,
-        "title": file_path.split("/")[-1].split(".")[0],
+    player = get_player(interaction.guild.id)
+    if not player.free_slots():
+        await interaction.followup.send(f"Die Warteschlange ist voll (maximal {MAX_QUEUE_SIZE} Songs).", ephemeral=True)
+        return
+    if datei.size > UPLOAD_MAX_BYTES:
+        await interaction.followup.send(f"Die Datei ist zu groß (maximal {UPLOAD_MAX_BYTES / 1024 ** 2:.0f} MiB).", ephemeral=True)
+        return
+
+    # Bis der Download fertig ist, spielt ffmpeg die Datei direkt vom Discord-CDN
+    title = datei.filename.split(".")[0]
+    track = minimize_info({
+        "url": datei.url,
+        "webpage_url": datei.url,
+        "title": title,
         "uploader": interaction.user.name,
         "duration": datei.duration
-    }))
-    await interaction.followup.send(f"Als nächstes zur Warteschlange hinzugefügt: **{file_path.split('/')[-1].split('.')[0]}**")
+    })
+    player.queue.append(track)
+    asyncio.create_task(upload_store.ingest(datei, track))
+    await interaction.followup.send(f"Als nächstes zur Warteschlange hinzugefügt: **{title}**")
     voice_client = interaction.guild.voice_client
     if not voice_client or not voice_client.is_playing():
         await play_next_in_queue(interaction.guild, initial_interaction=interaction)
@@ -497,13 +3368,15 @@ async def skip(interaction: discord.Interaction):
 async def skip(interaction: discord.Interaction):
     voice_client = interaction.guild.voice_client
     if voice_client:
-        if len(music_queues[interaction.guild.id]["prev_songs"]) < 2:
+        player = get_player(interaction.guild.id)
+        if len(player.history) < 2:
             await interaction.response.send_message("Es gibt keinen vorherigen Song", ephemeral=True)
             return
 
-        music_queues[interaction.guild.id]["queue"].insert(0, music_queues[interaction.guild.id]["prev_songs"].pop(-1))
+        discard_prewarmed(interaction.guild.id)
+        player.step_back()
         if voice_client and voice_client.is_playing():
-            music_queues[interaction.guild.id]["queue"].insert(0, music_queues[interaction.guild.id]["prev_songs"].pop(-1))
+            player.step_back()
             voice_client.stop()
 
         await interaction.response.send_message("Zum vorherigen Song gesprungen", ephemeral=True)
@@ -515,62 +3388,181 @@ async def skip(interaction: discord.Interaction):
 @client.tree.command(name="leave", description="Stoppt die Wiedergabe und leert die Warteschlange.")
 async def leave(interaction: discord.Interaction):
     guild_id = interaction.guild.id
-    if guild_id in music_queues:
-        music_queues[guild_id]["queue"].clear()
-        music_queues[guild_id]["prev_songs"].clear()
+    player = get_player(guild_id)
+    discard_prewarmed(guild_id)
+    player.clear()
 
     voice_client = interaction.guild.voice_client
     if voice_client and voice_client.is_connected():
         voice_client.stop()
         await voice_client.disconnect()
         await interaction.response.send_message("Wiedergabe gestoppt und Warteschlange geleert.")
-        msg = music_queues[guild_id]["now_playing_message"]
-        await msg.unpin()
-        await msg.edit(view=None)
-        music_queues[guild_id].pop("now_playing_message")
+        await now_playing(player).finish()
     else:
         await interaction.response.send_message("Nichts zu stoppen.", ephemeral=True)
 
 
 @client.tree.command(name="loop-on", description="Stoppt die Wiedergabe und leert die Warteschlange.")
 async def loop_on(interaction: discord.Interaction):
-    music_queues[interaction.guild.id]["Loop"] = True
+    get_player(interaction.guild.id).loop = True
     await interaction.response.send_message("Endlosschleife ist aktiviert", ephemeral=True)
 
 
 @client.tree.command(name="loop-off", description="Stoppt die Wiedergabe und leert die Warteschlange.")
 async def loop_off(interaction: discord.Interaction):
-    music_queues[interaction.guild.id]["Loop"] = False
+    get_player(interaction.guild.id).loop = False
     await interaction.response.send_message("Endlosschleife ist deaktiviert", ephemeral=True)
 
 
 @client.tree.command(name="loop-status", description="Stoppt die Wiedergabe und leert die Warteschlange.")
 async def loop_status(interaction: discord.Interaction):
-    loop = music_queues[interaction.guild.id].get("Loop")
+    loop = get_player(interaction.guild.id).loop
     await interaction.response.send_message(f"Endlosschleife ist {'de' if loop is not True else ''}aktiviert", ephemeral=True)
 
 
-@client.tree.command(name="queue", description="Zeigt bis zu 30 Elemente der aktuellen Wiedergabeliste an")
+@client.tree.command(name="queue", description="Zeigt die Wiedergabeliste seitenweise an")
 async def queue(interaction: discord.Interaction):
-    if not music_queues.get(interaction.guild.id):
+    player = guild_players.get(interaction.guild.id)
+    if not player:
         await interaction.response.send_message("Es gibt keine Wiedergabeliste", ephemeral=True)
         return
-    prev = music_queues[interaction.guild.id].get("prev_songs")
-    queue = music_queues[interaction.guild.id].get("queue")
-
-    message = format_queue(prev, queue)
-    await interaction.response.send_message(message)
+    view = QueuePageView(player)
+    await interaction.response.send_message(view.render(), view=view)
 
 
 @client.tree.command(name="remove-old-pins", description="Entfernt alte Pins des Bots")
 async def queue(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True, thinking=True)
     await remove_old_pins(interaction)
-    await interaction.response.send_message("Alte Pins entfernt", ephemeral=True)
+    await interaction.followup.send("Alte Pins entfernt", ephemeral=True)
+
+
+@client.tree.command(name="status", description="Zeigt interne Statistiken des Bots an")
+@app_commands.default_permissions(administrator=True)
+async def status(interaction: discord.Interaction):
+    stats = extraction_engine.stats()
+    search_stats = autocomplete_pool.stats()
+    cache_stats = search_cache.stats()
+    limit_stats = rate_limiter.stats()
+    with stream_urls_lock:
+        cached_streams = len(stream_urls)
+    cache = audio_cache.stats()
+    uploads = upload_store.stats()
+    saved_edits = ui_stats["requested"] - ui_stats["delivered"] + ui_stats["bulk_deleted"]
+    resolve_lines = ""
+    for resolver in (info_cache, playlist_cache, stream_cache):
+        r = resolver.stats()
+        resolve_lines += (
+            f"**Auflösung {resolver.name}**: {r['size']}/{r['maxsize']} Einträge, {r['hits']} Treffer, "
+            f"{r['misses']} Fehltreffer ({r['store_hits']} aus der Datenbank), {r['coalesced']} zusammengelegt, {r['negative_hits']} negativ "
+            f"({r['negative']} gemerkt, Fehler: {r['errors']['permanent']} dauerhaft, "
+            f"{r['errors']['transient']} vorübergehend, {r['errors']['throttled']} gedrosselt)\n"
+        )
+    waiting = ", ".join(f"{name} {count}" for name, count in limit_stats["waiting"].items())
+    message = (
+        f"**Extraktion**: {stats['running']}/{stats['workers']} aktiv, {stats['queued']} wartend, "
+        f"{stats['completed']} erledigt\n"
+        f"Latenz p50 {stats['latency_p50']:.2f}s, p99 {stats['latency_p99']:.2f}s, "
+        f"Wartezeit p50 {stats['wait_p50']:.2f}s\n"
+        f"**Autovervollständigung**: {search_stats['workers']} Worker, "
+        f"Latenz p50 {search_stats['latency_p50']:.2f}s, p99 {search_stats['latency_p99']:.2f}s\n"
+        f"**Such-Cache**: {cache_stats['size']}/{cache_stats['maxsize']} Einträge, "
+        f"{cache_stats['hits']} Treffer ({cache_stats['hit_rate']:.0%}), {cache_stats['prefix_hits']} Präfix-Treffer, "
+        f"{cache_stats['misses']} Fehltreffer ({cache_stats['store_hits']} aus der Datenbank), {cache_stats['coalesced']} zusammengelegt, "
+        f"{cache_stats['superseded']} überholt\n"
+        f"**Rate-Limit**: {limit_stats['rate']:.2f}/{limit_stats['max_rate']:.2f} Anfragen/s, "
+        f"genutzt {limit_stats['used']:.2f}/s, Reserve {limit_stats['headroom']:.2f}/s, "
+        f"{limit_stats['tokens']:.1f} Tokens, wartend: {waiting}, {limit_stats['throttle_events']} Drosselungen\n"
+        f"**Stream-URLs**: {cached_streams} gültig gecacht, {stream_url_stats['hits']} wiederverwendet, "
+        f"{stream_url_stats['refreshes']} neu aufgelöst\n"
+        f"{resolve_lines}"
+        f"**Metadaten-Datenbank**: Trefferquote {metadata_store.hit_rate_summary()}\n"
+        f"**Audio-Cache**: {cache['files']} Dateien, {cache['bytes'] / 1024 ** 2:.0f}/{cache['max_bytes'] / 1024 ** 2:.0f} MiB, "
+        f"Trefferquote {cache['hit_rate']:.0%} ({cache['hits']}), {cache['bytes_saved'] / 1024 ** 2:.0f} MiB gespart, "
+        f"{cache['downloads']} geladen, {cache['downloading']} laden gerade, {cache['evictions']} verdrängt\n"
+        f"**Uploads**: {uploads['files']} Dateien, {uploads['bytes'] / 1024 ** 2:.0f}/{uploads['max_bytes'] / 1024 ** 2:.0f} MiB, "
+        f"{uploads['referenced']} in Warteschlangen, {uploads['deduplicated']} doppelt ({uploads['bytes_deduplicated'] / 1024 ** 2:.0f} MiB gespart), "
+        f"{uploads['evictions']} verdrängt\n"
+        f"**Nachrichten**: {ui_stats['requested']} Aktualisierungen angefordert, {ui_stats['sent']} REST-Aufrufe, "
+        f"{max(0, saved_edits)} eingespart ({ui_stats['unchanged']} unverändert, {ui_stats['bulk_deleted']} durch Sammel-Löschen), "
+        f"{ui_stats['rate_limit_waits']}x gebremst\n"
+        f"**Wiedergabe** ({PLAYBACK_MODE}):\n"
+    )
+    for label in ("vorgewärmt", "kalt"):
+        if track_gap.count(label):
+            message += (f"- Lücke zwischen Songs ({label}): p50 {track_gap.quantile(0.5, label) * 1000:.0f}ms, "
+                        f"p99 {track_gap.quantile(0.99, label) * 1000:.0f}ms\n")
+    for mode, cpu in playback_cpu_stats.items():
+        audio_seconds = cpu["audio_seconds"] or 1
+        message += (
+            f"- {mode}: {cpu['streams']} Streams, ffmpeg {cpu['ffmpeg_cpu'] / audio_seconds:.1%} CPU, "
+            f"Player-Thread {cpu['player_cpu'] / audio_seconds:.1%} CPU\n"
+        )
+    if LOUDNESS_NORMALIZATION:
+        loudness = loudness_analyzer.stats()
+        message += (
+            f"**Lautheit** (Ziel {LOUDNESS_TARGET:g} LUFS): {loudness['analyzed']} Songs vermessen, {loudness['failed']} fehlgeschlagen, "
+            f"{loudness['running']} laufen, {loudness['pending']} geplant, Messung p50 {loudness_analysis_duration.quantile(0.5):.1f}s, "
+            f"p99 {loudness_analysis_duration.quantile(0.99):.1f}s\n"
+            f"- Abdeckung {loudness['coverage']:.0%}: {loudness['precomputed']} Wiedergaben mit gespeicherter Messung, "
+            f"{loudness['fallback']} mit loudnorm geschätzt, {loudness['unmeasured']} unverändert (Opus ohne Messung)\n"
+        )
+    if SHARED_SOURCES:
+        shared = shared_sources.stats()
+        message += (
+            f"**Geteilte Quellen**: {shared['streams']} Pipelines mit {shared['listeners']} Zuhörern, "
+            f"{shared['joined']} von {shared['started'] + shared['joined']} ffmpeg-Prozessen gespart, "
+            f"~{shared['shared_bytes'] / 1024 ** 2:.1f} MiB nicht erneut geladen und kodiert, "
+            f"{shared['buffered_bytes'] / 1024 ** 2:.1f} MiB gepuffert\n"
+        )
+    if AUDIO_SCHEDULER == "shared":
+        scheduler = audio_scheduler.stats()
+        message += (
+            f"**Audio-Takt**: {scheduler['active']} Verbindungen, {scheduler['readers']} Reader-Threads, "
+            f"Takt p99 {audio_tick_duration.quantile(0.99) * 1000:.1f}ms, {scheduler['late_ticks']}/{scheduler['ticks']} Takte verspätet, "
+            f"{scheduler['missed']} von {scheduler['frames']} Frames mit verpasster Frist\n"
+        )
+        worst = sorted(scheduler["guilds"].items(), key=lambda item: item[1]["late"] + item[1]["underrun"], reverse=True)
+        for guild_id, counts in worst[:3]:
+            if not counts["late"] + counts["underrun"]:
+                break
+            guild = client.get_guild(guild_id)
+            message += (f"- {guild.name if guild else guild_id}: {counts['late']} verspätet, "
+                        f"{counts['underrun']} ohne vorgelesenen Frame\n")
+    # Discord erlaubt 2000 Zeichen pro Nachricht
+    chunks = [""]
+    for line in message.splitlines(keepends=True):
+        if len(chunks[-1]) + len(line) > 2000:
+            chunks.append("")
+        chunks[-1] += line
+    await interaction.response.send_message(chunks[0], ephemeral=True)
+    for chunk in chunks[1:]:
+        await interaction.followup.send(chunk, ephemeral=True)
+
+
+@client.tree.command(name="metrics", description="Zeigt Latenzen und Füllstände an, die komplette Ausgabe als Datei")
+@app_commands.default_permissions(administrator=True)
+async def metrics_command(interaction: discord.Interaction):
+    exposition = discord.File(io.BytesIO(metrics.render().encode()), filename="metrics.txt")
+    await interaction.response.send_message(format_metrics_summary()[:2000], file=exposition, ephemeral=True)
+
+
+@client.tree.command(name="resources", description="Zeigt Speicher und Ressourcen pro Server an")
+@app_commands.default_permissions(administrator=True)
+async def resources(interaction: discord.Interaction):
+    await interaction.response.send_message(format_resource_report()[:2000], ephemeral=True)
 
 
 if __name__ == '__main__':
+    startup_times["import"] = process_uptime()
+    if PLAYBACK_MODE == "pcm":
+        load_opus()  # im Opus-Modus kodiert ffmpeg, discord.py braucht dann keine libopus
     if not os.path.isdir("temp_audio"):
         os.mkdir("temp_audio")
+    audio_cache.load()
+    upload_store.load()
+    autocomplete_pool.start()  # vor allen anderen Threads forken
+    metadata_store.open()
     dc_token = os.getenv('DC_TOKEN')
     if not dc_token:
         print("KRITISCHER FEHLER: DC_TOKEN wurde nicht in der .env-Datei gefunden.")